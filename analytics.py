@@ -0,0 +1,280 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+import archive
+import migrations
+import stats
+
+CHUNK_ROWS = 100_000
+# Per-user counters: one column per service bit, then one per supply bit.
+FLAG_COLUMNS = migrations.SERVICE_BITS + migrations.SUPPLY_BITS
+SERVICES = len(migrations.SERVICE_BITS)
+SERVICE_NAMES = np.array([stats.SERVICE_LABELS[bit] for bit in migrations.SERVICE_BITS] + [''], dtype=object)
+NEVER = np.iinfo(np.int64).max
+# Visitor table sort choices -> column of the per-user arrays.
+VISITOR_SORTS = {
+    'Last visit': 'last',
+    'Visits': 'visits',
+    'First visit': 'first',
+    'Last name': 'lastname',
+    'Email': 'ucnetid',
+}
+VISITOR_PAGE = 50
+
+
+class VisitCache:
+    # Every visit, archived months included, as parallel NumPy arrays (epoch,
+    # user code, services and supplies masks) plus per-user totals kept up to
+    # date as rows are appended. The first refresh loads everything; later
+    # ones only read visits past the last visit_id seen. Edits and deletes
+    # bump meta.visits_version and force a full reload.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._visits_version = None
+        self._users_key = None
+        self._last_id = 0
+        self._rows = 0
+        self.ts = np.empty(0, np.int64)
+        self.user = np.empty(0, np.int32)
+        self.services = np.empty(0, np.uint8)
+        self.supplies = np.empty(0, np.uint8)
+        self._codes = pd.Index([], dtype=object)
+        self.ucnetids = np.empty(0, object)
+        self.visits = np.empty(0, np.int64)
+        self.first_visit = np.empty(0, np.int64)
+        self.last_visit = np.empty(0, np.int64)
+        self.supply_visits = np.empty(0, np.int64)
+        self.flags = np.empty((0, len(FLAG_COLUMNS)), np.int64)
+        self.known = np.empty(0, bool)
+        self.enabled = np.empty(0, bool)
+        self.firstname = np.empty(0, object)
+        self.lastname = np.empty(0, object)
+        self._sort_keys = {}
+        self._refreshed = time.time()
+        self._tables = {}
+        self._orders = {}
+
+    def __len__(self):
+        return self._rows
+
+    def refresh(self, conn):
+        with self._lock:
+            versions = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('visits_version', 'users_version')"))
+            if versions.get('visits_version') != self._visits_version:
+                self._reset()
+                for partition in archive.partitions(conn):
+                    with archive.attached(conn, partition) as visits:
+                        self._load(conn.execute(f'SELECT visit_id, ts, ucnetid, services, supplies FROM {visits}'))
+                self._visits_version = versions.get('visits_version')
+            # Only the live table's ids count: archived ids can be higher when
+            # visits were inserted out of timestamp order.
+            self._last_id = self._load(conn.execute('''SELECT visit_id, ts, ucnetid, services, supplies
+                                                       FROM main.visits
+                                                       WHERE visit_id > ?
+                                                       ORDER BY visit_id''', (self._last_id,)), self._last_id)
+            # New users don't bump users_version, so the highest rowid is part of the key.
+            users_key = (versions.get('users_version'), conn.execute('SELECT MAX(rowid) FROM users').fetchone()[0])
+            if users_key != self._users_key:
+                self._load_users(conn)
+                self._users_key = users_key
+            # Window tables are cut again on the first page asked for after
+            # each refresh; until the next one, paging only slices them.
+            self._refreshed = time.time()
+            self._tables = {}
+            self._orders = {}
+
+    def _user_codes(self, ucnetids):
+        codes = self._codes.get_indexer(ucnetids)
+        if (codes < 0).any():
+            self._codes = self._codes.append(pd.Index(pd.unique(ucnetids[codes < 0]), dtype=object))
+            codes = self._codes.get_indexer(ucnetids)
+            grow = len(self._codes) - len(self.ucnetids)
+            self.ucnetids = self._codes.to_numpy()
+            self.visits = np.concatenate([self.visits, np.zeros(grow, np.int64)])
+            self.first_visit = np.concatenate([self.first_visit, np.full(grow, NEVER, np.int64)])
+            self.last_visit = np.concatenate([self.last_visit, np.zeros(grow, np.int64)])
+            self.supply_visits = np.concatenate([self.supply_visits, np.zeros(grow, np.int64)])
+            self.flags = np.concatenate([self.flags, np.zeros((grow, len(FLAG_COLUMNS)), np.int64)])
+            self.known = np.concatenate([self.known, np.zeros(grow, bool)])
+            self.enabled = np.concatenate([self.enabled, np.zeros(grow, bool)])
+            self.firstname = np.concatenate([self.firstname, np.full(grow, None, object)])
+            self.lastname = np.concatenate([self.lastname, np.full(grow, None, object)])
+        return codes.astype(np.int32)
+
+    def _append(self, ts, user, services, supplies):
+        # Row arrays grow by doubling so an append doesn't copy the whole history.
+        end = self._rows + len(ts)
+        if end > len(self.ts):
+            capacity = max(end, 2 * len(self.ts))
+            for name in ('ts', 'user', 'services', 'supplies'):
+                column = getattr(self, name)
+                grown = np.empty(capacity, column.dtype)
+                grown[:self._rows] = column[:self._rows]
+                setattr(self, name, grown)
+        self.ts[self._rows:end] = ts
+        self.user[self._rows:end] = user
+        self.services[self._rows:end] = services
+        self.supplies[self._rows:end] = supplies
+        self._rows = end
+
+        users = len(self.ucnetids)
+        self.visits += np.bincount(user, minlength=users)
+        np.minimum.at(self.first_visit, user, ts)
+        np.maximum.at(self.last_visit, user, ts)
+        self.supply_visits += np.bincount(user, weights=supplies != 0, minlength=users).astype(np.int64)
+        flags = services.astype(np.int64) | supplies.astype(np.int64) << len(migrations.SERVICE_BITS)
+        for bit in range(len(FLAG_COLUMNS)):
+            self.flags[:, bit] += np.bincount(user, weights=flags >> bit & 1, minlength=users).astype(np.int64)
+
+    def _load(self, cursor, last_id=0):
+        # Appends every row from cursor and returns the highest visit_id seen.
+        try:
+            while rows := cursor.fetchmany(CHUNK_ROWS):
+                visit_ids, ts, ucnetids, services, supplies = zip(*rows)
+                self._append(np.array(ts, np.int64), self._user_codes(np.array(ucnetids, object)),
+                             np.array(services, np.uint8), np.array(supplies, np.uint8))
+                last_id = max(last_id, max(visit_ids))
+        finally:
+            cursor.close()
+        return last_id
+
+    def _load_users(self, conn):
+        rows = conn.execute('SELECT ucnetid, firstname, lastname, enabled_user = 1 FROM users').fetchall()
+        if not rows:
+            return
+        ucnetids, firstnames, lastnames, enabled = zip(*rows)
+        codes = self._user_codes(np.array(ucnetids, object))
+        self.known[:] = False
+        self.enabled[:] = False
+        self.known[codes] = True
+        self.enabled[codes] = np.array(enabled, bool)
+        self.firstname[codes] = firstnames
+        self.lastname[codes] = lastnames
+        self._sort_keys = {}
+        self._orders = {}
+
+    def _aggregate(self, user, ts, services):
+        # Visits, first and last visit and per-service counts of the users in user.
+        count = len(self.ucnetids)
+        visits = np.bincount(user, minlength=count)
+        first = np.full(count, NEVER, np.int64)
+        last = np.zeros(count, np.int64)
+        np.minimum.at(first, user, ts)
+        np.maximum.at(last, user, ts)
+        per_service = np.stack([np.bincount(user, weights=services >> bit & 1, minlength=count)
+                                for bit in range(SERVICES)], axis=1)
+        users = np.flatnonzero(visits)
+        return users, visits[users], first[users], last[users], per_service[users]
+
+    def _visitors(self, window=None):
+        # Per-user aggregates for a stats.WINDOWS window: enabled visitors
+        # only, like the dashboard always showed. All time (None) reads the
+        # running totals and keeps disabled users who are still known.
+        if window in self._tables:
+            return self._tables[window]
+        if window is None:
+            users = np.flatnonzero((self.visits > 0) & self.known)
+            self._tables[None] = (users, self.visits[users], self.first_visit[users], self.last_visit[users],
+                                  self.flags[users, :SERVICES])
+            return self._tables[None]
+        # Every window comes out of one scan for the rows of the longest.
+        cutoffs = {label: int(self._refreshed - span.total_seconds()) for label, span in stats.WINDOWS.items()}
+        rows = np.flatnonzero(self.ts[:self._rows] >= min(cutoffs.values()))
+        rows = rows[self.enabled[self.user[rows]]]
+        user, ts, services = self.user[rows], self.ts[rows], self.services[rows]
+        for label, cutoff in cutoffs.items():
+            inside = ts >= cutoff
+            self._tables[label] = self._aggregate(user[inside], ts[inside], services[inside])
+        return self._tables[window]
+
+    def _sort_key(self, column):
+        # Every user's ucnetid or last name, its sort rank and the sorted
+        # distinct values. Sorting strings is the slow part of a page, so
+        # these are kept until users are reloaded or new ones appear.
+        cached = self._sort_keys.get(column)
+        if cached is None or len(cached[0]) != len(self.ucnetids):
+            values = self.ucnetids if column == 'ucnetid' else np.array([name or '' for name in self.lastname], object)
+            ranks, uniques = pd.factorize(values, sort=True)
+            cached = self._sort_keys[column] = (values, ranks, uniques)
+        return cached
+
+    def _order(self, window, column, descending):
+        # A window's visitors sorted for one table: the order, the sort
+        # value and rank of each row in it and each row's ucnetid.
+        cached = self._orders.get((window, column, descending))
+        if cached is None:
+            users, visits, first, last, _ = self._visitors(window)
+            ids, id_ranks, _ = self._sort_key('ucnetid')
+            ids, id_ranks = ids[users], id_ranks[users]
+            if column in ('lastname', 'ucnetid'):
+                key, ranks, _ = self._sort_key(column)
+                key, ranks = key[users], ranks[users]
+            else:
+                key = ranks = {'visits': visits, 'first': first, 'last': last}[column]
+            ranks = -ranks if descending else ranks
+            order = np.lexsort((id_ranks, ranks))
+            cached = self._orders[window, column, descending] = (order, key[order], ranks[order], ids[order])
+        return cached
+
+    def _after(self, column, descending, ranks, ids, after):
+        # Where the page following the (value, ucnetid) key starts, by binary
+        # search. A name that is gone since falls between its neighbours.
+        value, ucnetid = after
+        if column in ('lastname', 'ucnetid'):
+            uniques = self._sort_key(column)[2]
+            rank = uniques.searchsorted(value)
+            rank = rank if rank < len(uniques) and uniques[rank] == value else rank - 0.5
+        else:
+            rank = value
+        rank = -rank if descending else rank
+        start, end = ranks.searchsorted(rank, 'left'), ranks.searchsorted(rank, 'right')
+        return start + ids[start:end].searchsorted(ucnetid, 'right')
+
+    def visitor_page(self, window=None, sort='Last visit', descending=True, after=None, limit=VISITOR_PAGE):
+        # One page of a visitor table, one row per user, ordered by the sort
+        # column and then ucnetid. after is the (value, ucnetid) key of the
+        # previous page's last row. Returns the page, its own last key and
+        # the number of visitors in the table.
+        with self._lock:
+            users, visits, first, last, per_service = self._visitors(window)
+            column = VISITOR_SORTS[sort]
+            order, keys, ranks, ids = self._order(window, column, descending)
+            start = 0 if after is None else self._after(column, descending, ranks, ids, after)
+        end = min(start + limit, len(order))
+        page = order[start:end]
+        top = np.where(per_service[page].max(axis=1) > 0, per_service[page].argmax(axis=1), SERVICES)
+        df = pd.DataFrame({
+            'First Name': self.firstname[users[page]],
+            'Last Name': self.lastname[users[page]],
+            'Email': ids[start:end],
+            'Visits': visits[page],
+            'First Visit': pd.to_datetime(first[page], unit='s'),
+            'Last Visit': pd.to_datetime(last[page], unit='s'),
+            'Top Service': SERVICE_NAMES[top],
+        })
+        last_key = (keys[end - 1], ids[end - 1]) if end < len(order) and len(page) == limit else None
+        return df, last_key, len(users)
+
+    def service_counts(self):
+        # Services only count visits by enabled users; the supplies total counts everyone.
+        totals = self.flags[self.enabled].sum(axis=0)
+        counts = {label: int(totals[FLAG_COLUMNS.index(name)]) for name, label in stats.SERVICE_LABELS.items()}
+        counts['Supplies'] = int(self.supply_visits.sum())
+        return counts
+
+    def supply_counts(self):
+        totals = self.flags.sum(axis=0)
+        return {label: int(totals[FLAG_COLUMNS.index(name)]) for name, label in stats.SUPPLY_LABELS.items()}
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache():
+    return VisitCache()
@@ -0,0 +1,223 @@
+import argparse
+import calendar
+import json
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+import migrations
+
+# Live visits keeps the current month plus this many full months;
+# the dashboard's time windows never reach past that.
+KEEP_MONTHS = 3
+ARCHIVE_DIR = 'archive'
+VISIT_COLUMNS = 'visit_id, ucnetid, ts, services, supplies'
+# archive_partitions.format: 1 is the old transaction_log table, 2 is visits.
+FORMAT = 2
+
+
+def _main_file(conn):
+    return next(Path(row[2]) for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+
+
+def to_epoch(day):
+    return calendar.timegm(day.timetuple())
+
+
+def partitions(conn, start=None, end=None):
+    # (month, path) of archived months overlapping [start, end) epoch seconds,
+    # oldest first. The manifest keeps readable timestamps.
+    return conn.execute('''SELECT month, path
+                           FROM archive_partitions
+                           WHERE last_timestamp >= COALESCE(datetime(?, 'unixepoch'), '')
+                             AND first_timestamp < COALESCE(datetime(?, 'unixepoch'), '9999')
+                           ORDER BY month''', (start, end)).fetchall()
+
+
+@contextmanager
+def attached(conn, partition, name='archive', create=False):
+    # ATTACH/DETACH can't run inside a transaction, so callers open their own
+    # transactions after this.
+    month, path = partition
+    path = _main_file(conn).parent / path
+    if not create and not path.exists():
+        raise FileNotFoundError(f'archive partition for {month} is missing: {path}')
+    conn.execute(f'ATTACH DATABASE ? AS {name}', (str(path),))
+    try:
+        yield f'{name}.visits'
+    finally:
+        conn.execute(f'DETACH DATABASE {name}')
+
+
+def closed_months(conn, keep_months=KEEP_MONTHS):
+    return [row[0] for row in conn.execute('''SELECT DISTINCT strftime('%Y-%m', ts, 'unixepoch')
+                                              FROM visits
+                                              WHERE ts < CAST(strftime('%s', 'now', 'start of month', ?) AS INTEGER)
+                                              ORDER BY 1''', (f'-{keep_months} months',))]
+
+
+def archive_month(conn, month):
+    year, number = map(int, month.split('-'))
+    start = to_epoch(date(year, number, 1))
+    end = to_epoch(date(year + number // 12, number % 12 + 1, 1))
+    relative = Path(ARCHIVE_DIR) / f"visits_{month.replace('-', '_')}.db"
+    path = _main_file(conn).parent / relative
+    if conn.execute('SELECT 1 FROM archive_partitions WHERE month = ?', (month,)).fetchone():
+        return 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Left over from a run that stopped before the manifest was written.
+    path.unlink(missing_ok=True)
+
+    with attached(conn, (month, relative), 'partition', create=True):
+        # The partition file is committed on its own first; the live rows are
+        # only deleted once it is complete, so a crash in between just means
+        # this month gets archived again next time.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            _create_visits(conn, 'partition')
+            conn.execute(f'''INSERT INTO partition.visits ({VISIT_COLUMNS})
+                             SELECT {VISIT_COLUMNS} FROM main.visits
+                             WHERE ts >= ? AND ts < ?
+                             ORDER BY ts''', (start, end))
+            _index_visits(conn, 'partition')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            archived, first, last = conn.execute('''SELECT COUNT(*), datetime(MIN(ts), 'unixepoch'), datetime(MAX(ts), 'unixepoch')
+                                                    FROM partition.visits''').fetchone()
+            live = conn.execute('SELECT COUNT(*) FROM main.visits WHERE ts >= ? AND ts < ?', (start, end)).fetchone()[0]
+            if archived != live:
+                raise RuntimeError(f'{month}: copied {archived} visits but {live} are live')
+            if archived:
+                conn.execute('''INSERT INTO archive_partitions (month, path, first_timestamp, last_timestamp, visits, format)
+                                VALUES (?, ?, ?, ?, ?, ?)''', (month, relative.as_posix(), first, last, archived, FORMAT))
+                # Archived visits stay counted in visit_rollup, and the
+                # month's report snapshot is still accurate.
+                conn.execute('DROP TRIGGER visits_rollup_delete')
+                conn.execute('DROP TRIGGER visits_snapshot_delete')
+                conn.execute('DELETE FROM main.visits WHERE ts >= ? AND ts < ?', (start, end))
+                migrations.create_rollup_triggers(conn)
+                migrations.create_snapshot_triggers(conn)
+                # A snapshot of this month being built right now may have
+                # read the live table after the delete.
+                conn.execute('DELETE FROM report_snapshots WHERE path IS NULL AND start_ts < ? AND end_ts > ?',
+                             (end, start))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if not archived:
+        path.unlink()
+    return archived
+
+
+def _create_visits(conn, schema):
+    conn.execute(f'''CREATE TABLE {schema}.visits (
+    visit_id INTEGER PRIMARY KEY,
+    ucnetid TEXT,
+    ts INTEGER,
+    services INTEGER NOT NULL DEFAULT 0,
+    supplies INTEGER NOT NULL DEFAULT 0
+)''')
+
+
+def _index_visits(conn, schema):
+    conn.execute(f'CREATE INDEX {schema}.idx_visits_ts ON visits (ts, ucnetid)')
+    conn.execute(f'CREATE INDEX {schema}.idx_visits_ucnetid_ts ON visits (ucnetid, ts)')
+
+
+def upgrade_partitions(conn):
+    # Rewrites partitions archived before migration 12 into the visits format,
+    # using the same conversion as the live table. Safe to rerun after a crash:
+    # a file that already has visits just gets its manifest row updated.
+    upgraded = 0
+    for partition in conn.execute('SELECT month, path FROM archive_partitions WHERE format < ? ORDER BY month',
+                                  (FORMAT,)).fetchall():
+        with attached(conn, partition, 'partition'):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if not conn.execute("SELECT 1 FROM partition.sqlite_master WHERE name = 'visits'").fetchone():
+                    _create_visits(conn, 'partition')
+                    conn.execute(f'''INSERT INTO partition.visits ({VISIT_COLUMNS})
+                                     SELECT t.visit_id, t.ucnetid, CAST(strftime('%s', t.timestamp) AS INTEGER),
+                                            {migrations.services_mask('t')}, {migrations.supplies_mask('s')}
+                                     FROM partition.transaction_log t
+                                     LEFT JOIN main.supplies s ON s.supply_id = t.supply_id
+                                     ORDER BY t.visit_id''')
+                    conn.execute('DROP TABLE partition.transaction_log')
+                    _index_visits(conn, 'partition')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        conn.execute('UPDATE archive_partitions SET format = ? WHERE month = ?', (FORMAT, partition[0]))
+        conn.commit()
+        upgraded += 1
+    return upgraded
+
+
+def archive(conn, keep_months=KEEP_MONTHS):
+    return {month: archive_month(conn, month) for month in closed_months(conn, keep_months)}
+
+
+def user_enabled_changed(conn, ucnetids, enabled):
+    # The users rollup triggers only see live visits; this moves the users'
+    # archived visits between the enabled/disabled rollup buckets to match.
+    # Call it after committing the enabled_user change.
+    where = 't.ucnetid IN (SELECT value FROM json_each(?))'
+    params = (json.dumps(list(ucnetids)),)
+    for partition in partitions(conn):
+        with attached(conn, partition) as visits:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(migrations.rollup_upsert(visits, -1, str(int(not enabled)), where), params)
+                conn.execute(migrations.rollup_upsert(visits, 1, str(int(enabled)), where), params)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+
+def rebuild_rollup(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    migrations.rebuild_visit_rollup(conn)
+    conn.commit()
+    for partition in partitions(conn):
+        with attached(conn, partition) as visits:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute(migrations.rollup_upsert(visits))
+            conn.commit()
+
+
+def main():
+    import db
+
+    parser = argparse.ArgumentParser(description='Move closed months of visits into archive partitions.')
+    parser.add_argument('--keep-months', type=int, default=KEEP_MONTHS,
+                        help='full months to keep live besides the current one')
+    parser.add_argument('--list', action='store_true', help='show the archive manifest and exit')
+    parser.add_argument('--rebuild-rollup', action='store_true',
+                        help='recompute visit_rollup from the live table and every partition')
+    parser.add_argument('--upgrade', action='store_true',
+                        help='convert partitions archived before the visits table to its format')
+    args = parser.parse_args()
+
+    with db.connection('archive') as conn:
+        if args.list:
+            for row in conn.execute('SELECT month, path, visits, first_timestamp, last_timestamp FROM archive_partitions ORDER BY month'):
+                print(*row, sep='\t')
+        elif args.rebuild_rollup:
+            rebuild_rollup(conn)
+        elif args.upgrade:
+            print(f'upgraded {upgrade_partitions(conn)} partitions')
+        else:
+            for month, visits in archive(conn, args.keep_months).items():
+                print(f'{month}: archived {visits} visits')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import hashlib
+import io
+import threading
+import time
+
+import streamlit as st
+
+import db
+
+# Widths each image is rendered at on the kiosk screens.
+WIDTHS = {
+    'banner.png': (450,),
+    'new.png': (190, 100),
+    'return.png': (190, 100),
+}
+CHECK_INTERVAL = 30
+
+
+def resize(data, width):
+    # PIL (and the numpy it pulls in) is only needed when an image changes.
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if image.width <= width:
+        return data
+    height = round(image.height * width / image.width)
+    out = io.BytesIO()
+    image.resize((width, height), Image.LANCZOS).save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+class AssetCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0
+        self._hashes = {}
+        self._variants = {}
+
+    def _current_version(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'binary_data_version'").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._checked < CHECK_INTERVAL:
+                return
+            with db.connection('assets') as conn:
+                version = self._current_version(conn)
+                if version != self._version:
+                    rows = conn.execute('SELECT filename, data FROM binary_data').fetchall()
+                    stored = {(digest, width): data for digest, width, data in
+                              conn.execute('SELECT digest, width, data FROM image_variants')}
+            self._checked = time.monotonic()
+            if version == self._version:
+                return
+
+            hashes = {}
+            variants = {}
+            resized = []
+            for filename, data in rows:
+                digest = hashlib.sha256(data).hexdigest()
+                hashes[filename] = digest
+                variants[(digest, None)] = data
+                for width in WIDTHS.get(filename, ()):
+                    key = (digest, width)
+                    # Unchanged images keep their already-resized variants.
+                    variants[key] = self._variants.get(key) or stored.get(key)
+                    if variants[key] is None:
+                        variants[key] = resize(data, width)
+                        resized.append((digest, width, variants[key]))
+            if resized:
+                with db.connection('assets') as conn:
+                    conn.executemany('INSERT OR IGNORE INTO image_variants (digest, width, data) VALUES (?, ?, ?)',
+                                     resized)
+            self._hashes = hashes
+            self._variants = variants
+            self._version = version
+
+    def image(self, filename, width=None):
+        self.refresh()
+        digest = self._hashes[filename]
+        data = self._variants.get((digest, width))
+        if data is None:
+            data = resize(self._variants[(digest, None)], width)
+            with self._lock:
+                self._variants[(digest, width)] = data
+        return data
+
+
+@st.cache_resource(show_spinner=False)
+def get_assets():
+    assets = AssetCache()
+    assets.refresh(force=True)
+    return assets
@@ -0,0 +1,210 @@
+import argparse
+import io
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+from bench import fixtures
+
+ROOT = Path(__file__).resolve().parent.parent
+PLANS = Path(__file__).parent / 'plans.json'
+# A SCAN of one of these fails the check unless the path allows that exact
+# step, and so does a changed plan that starts reading one in full.
+GUARDED = ('visits', 'transaction_log', 'users', 'visit_rollup')
+
+
+class CodePath:
+    # One entry of the registry: a code path that runs some of the app's SQL
+    # (or a list of statements explained directly), the indexes its plans
+    # must use, and the SCAN steps on guarded tables it may have, with why.
+
+    def __init__(self, run=None, statements=(), uses=(), scans=None):
+        self.run = run
+        self.statements = statements
+        self.uses = uses
+        self.scans = scans or {}
+
+
+def registry():
+    import analytics
+    import archive
+    import assets
+    import checkin
+    import db
+    import roster
+    import snapshots
+    import stats
+    import user_admin
+    import user_index
+    import writer
+
+    today = date.today()
+    with db.connection('check_plans') as conn:
+        ucnetid = conn.execute('''SELECT ucnetid FROM users
+                                              WHERE enabled_user = 1 ORDER BY rowid LIMIT 1''').fetchone()[0]
+
+    def with_conn(call):
+        def run():
+            with db.connection('check_plans') as conn:
+                call(conn)
+        return run
+
+    def roster_sync(conn):
+        lines = io.StringIO(f'ucnetid,firstname,lastname\n{ucnetid},Plan,Check\nplancheck1,Plan,Check\n')
+        roster.sync(conn, lines)
+
+    return {
+        # check_user only reaches SQL when the in-memory index misses.
+        'check_user': CodePath(lambda: checkin.check_user('plan-check-miss', 'plan-check-miss'),
+                            uses=['sqlite_autoindex_users_1', 'idx_users_student_id']),
+        'user_index_refresh': CodePath(lambda: user_index.UserIndex().refresh(force=True),
+                                    uses=['idx_users_enabled_user']),
+        'add_new_user': CodePath(lambda: checkin.add_new_user('plancheck0', 'Plan', 'Check', 'Other', 'No', 'No',
+                                                           'Computer Science', 'Junior', '', 'plan0')),
+        'record_transaction': CodePath(lambda: checkin.record_transaction(ucnetid, [checkin.PURPOSES['tutor']], 1)),
+        'writer_operations': CodePath(statements=list(writer.OPERATIONS.values())
+                                   + ['SELECT 1 FROM applied_writes WHERE op_id = ?',
+                                      'DELETE FROM applied_writes WHERE journal = ?']),
+        'user_search': CodePath(with_conn(lambda conn: (user_admin.search(conn), user_admin.search(conn, 'mar', 'All'),
+                                                     user_admin.search(conn, '', 'Disabled', 2))),
+                             uses=['idx_users_name', 'users_fts'],
+                             scans={'SCAN users USING INDEX idx_users_name':
+                                        'pages walk the name index in order and stop at LIMIT',
+                                    'SCAN users USING COVERING INDEX idx_users_enabled_user':
+                                        'the Disabled count reads only the enabled_user index'}),
+        'set_enabled': CodePath(lambda: (user_admin.set_enabled([ucnetid], 0), user_admin.set_enabled([ucnetid], 1)),
+                             uses=['sqlite_autoindex_users_1']),
+        'roster_sync': CodePath(with_conn(roster_sync), uses=['sqlite_autoindex_users_1']),
+        'demographics': CodePath(with_conn(stats.demographics), uses=['idx_users_enabled_user']),
+        'visits_over_time': CodePath(with_conn(lambda conn: [stats.visits_over_time(conn, grain) for grain in stats.GRAINS]),
+                                  scans={'SCAN visit_rollup': 'the Week chart covers all history'}),
+        'date_range_report': CodePath(with_conn(lambda conn: stats.date_range_report(conn, today - timedelta(days=120), today)),
+                                   uses=['idx_visits_ts']),
+        'export_chunks': CodePath(with_conn(lambda conn: (stats.date_range_count(conn, today - timedelta(days=30), today),
+                                                       list(stats.date_range_chunks(conn, today - timedelta(days=30), today)))),
+                               uses=['idx_visits_ts']),
+        'report_snapshots': CodePath(with_conn(lambda conn: snapshots.date_range_report(conn, today - timedelta(days=60), today,
+                                                                                   snapshots.SnapshotCache())),
+                                  uses=['idx_visits_ts', 'idx_users_enabled_user']),
+        'visit_cache': CodePath(with_conn(lambda conn: analytics.VisitCache().refresh(conn)),
+                             scans={'SCAN users': 'the cache holds every user',
+                                    'SCAN archive.visits': 'and every archived visit'}),
+        'assets': CodePath(lambda: assets.AssetCache().refresh(force=True)),
+        'archive': CodePath(with_conn(lambda conn: archive.archive(conn)), uses=['idx_visits_ts'],
+                            scans={'SCAN partition.visits USING COVERING INDEX idx_visits_ucnetid_ts':
+                                       'the finished partition is counted against the live rows'}),
+    }
+
+
+def plans_for(name, path):
+    import db
+    import profiler
+
+    profiler.PROFILER.clear()
+    if path.run:
+        path.run()
+    seen = {}
+    for query in profiler.PROFILER.queries():
+        seen.setdefault(query['sql'], query['plan'])
+    if path.statements:
+        with db.connection('check_plans') as conn:
+            for sql in path.statements:
+                seen.setdefault(' '.join(sql.split()), profiler.PROFILER.plan(conn, sql)['plan'])
+    return seen
+
+
+def scanned(plan):
+    # The SCAN steps of a plan on guarded tables, mapped to the table.
+    # Attached partitions keep their schema prefix.
+    steps = {}
+    for step in plan.split('; '):
+        words = step.split()
+        if len(words) > 1 and words[0] == 'SCAN':
+            table = words[1].removeprefix('main.')
+            if table.split('.')[-1] in GUARDED:
+                steps[' '.join(['SCAN', table] + words[2:])] = table
+    return steps
+
+
+def check(path, plans, before):
+    problems = []
+    for sql, plan in plans.items():
+        for step, table in sorted(scanned(plan).items()):
+            if step not in path.scans:
+                problems.append(f'{step}: {sql}\n      plan: {plan}')
+            elif step == f'SCAN {table}' and sql in before and step not in scanned(before[sql]):
+                problems.append(f'plan changed to a full scan of {table}: {sql}\n'
+                                f'      was: {before[sql]}\n      now: {plan}')
+    for index in path.uses:
+        if not any(index in plan for plan in plans.values()):
+            problems.append(f'{index} is not used by any statement')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the app's SQL query plans against a fixture database.")
+    parser.add_argument('--size', choices=fixtures.SIZES, default='small', help='fixture preset (generated if missing)')
+    parser.add_argument('--db', help='use this fixture instead of a preset')
+    parser.add_argument('--only', action='append', help='check just this registry path (repeatable)')
+    parser.add_argument('--verbose', action='store_true', help='print every statement and its plan')
+    parser.add_argument('--plans', default=str(PLANS), help='saved plans to compare against')
+    parser.add_argument('--save', action='store_true', help='overwrite the saved plans with these')
+    args = parser.parse_args()
+
+    source = Path(args.db) if args.db else fixtures.ensure(args.size)
+    workdir = Path(tempfile.mkdtemp(prefix='oai-plans-'))
+    work_db = workdir / 'sign_in.db'
+    shutil.copyfile(source, work_db)
+    # The app modules read these at import time, so they must come first.
+    os.environ['OAI_DB'] = str(work_db)
+    os.environ['OAI_PROFILE'] = '1'
+    os.environ['OAI_WRITE_BEHIND'] = '0'
+    sys.path.insert(0, str(ROOT))
+    import migrations
+    conn = sqlite3.connect(work_db)
+    migrations.migrate(conn)
+    conn.close()
+
+    saved = json.loads(Path(args.plans).read_text()) if Path(args.plans).exists() else {}
+    results = {}
+    failed = []
+    try:
+        for name, path in registry().items():
+            if args.only and name not in args.only:
+                continue
+            plans = plans_for(name, path)
+            results[name] = plans
+            before = saved.get(name, {})
+            problems = check(path, plans, before)
+            changed = [sql for sql, plan in plans.items() if sql in before and before[sql] != plan]
+            new = [sql for sql in plans if before and sql not in before]
+            print(f"{'FAIL' if problems else 'ok  '} {name} ({len(plans)} statements)")
+            for problem in problems:
+                print(f'    {problem}')
+            for sql in changed:
+                print(f'    plan changed: {sql}\n      was: {before[sql]}\n      now: {plans[sql]}')
+            for sql in new:
+                print(f'    new statement: {sql}\n      plan: {plans[sql]}')
+            if args.verbose:
+                for sql, plan in plans.items():
+                    print(f'    {sql}\n      plan: {plan or "-"}')
+            if problems:
+                failed.append(name)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        Path(args.plans).write_text(json.dumps(dict(saved, **results), indent=2, sort_keys=True) + '\n')
+    if failed:
+        print(f"{len(failed)} of {len(results)} paths regressed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import argparse
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+from faker import Faker
+
+import migrations
+
+# name -> (users, visits)
+SIZES = {
+    'small': (10_000, 100_000),
+    'medium': (100_000, 1_000_000),
+    'large': (100_000, 5_000_000),
+}
+DATA_DIR = Path(__file__).parent / 'data'
+APP_DB = Path(__file__).resolve().parent.parent / 'sign_in.db'
+
+MAJORS = ["Mechanical Engineering", "Electrical Engineering", "Computer Science",
+          "Civil Engineering", "Bioengineering", "Chemical Engineering",
+          "Materials Science", "Aerospace Engineering", "Software Engineering",
+          "Environmental Engineering", "Engineering Physics", "Other"]
+MAJOR_WEIGHTS = [12, 10, 20, 8, 9, 7, 4, 8, 10, 4, 3, 5]
+YEARS = ["Freshman", "Sophomore", "Junior", "Senior", "Graduate"]
+YEAR_WEIGHTS = [24, 22, 22, 20, 12]
+GENDERS = ["Male", "Female", "Other"]
+GENDER_WEIGHTS = [52, 44, 4]
+
+# Share of visits that tick each purpose, and of supply visits that take each supply.
+SERVICE_RATES = {'advice': 0.22, 'tutor': 0.35, 'wellness_corner': 0.15, 'hangout': 0.30, 'study_center': 0.45}
+SUPPLY_VISIT_RATE = 0.30
+SUPPLY_RATES = [0.45, 0.10, 0.15, 0.40, 0.35, 0.05]  # migrations.SUPPLY_BITS order
+# Front-desk traffic: open 8am-7pm, busiest late morning and just after lunch; quiet weekends.
+HOUR_WEIGHTS = np.array([0, 0, 0, 0, 0, 0, 0, 0, 4, 8, 12, 11, 9, 11, 10, 8, 6, 4, 2, 0, 0, 0, 0, 0], dtype=float)
+WEEKDAY_WEIGHTS = np.array([10, 10, 10, 10, 8, 1, 1], dtype=float)
+CHUNK = 100_000
+
+
+def _users(conn, count, fake, rng):
+    student_ids = rng.choice(9 * 10**8, size=count, replace=False) + 10**8
+    majors = rng.choice(MAJORS, size=count, p=np.array(MAJOR_WEIGHTS) / sum(MAJOR_WEIGHTS))
+    years = rng.choice(YEARS, size=count, p=np.array(YEAR_WEIGHTS) / sum(YEAR_WEIGHTS))
+    genders = rng.choice(GENDERS, size=count, p=np.array(GENDER_WEIGHTS) / sum(GENDER_WEIGHTS))
+    first_gen = rng.random(count) < 0.3
+    transfer = rng.random(count) < 0.25
+    enabled = rng.random(count) < 0.9
+    rows = []
+    ucnetids = []
+    for i in range(count):
+        first, last = fake.first_name(), fake.last_name()
+        ucnetid = f'{last}{first[0]}{i}'.lower().replace(' ', '').replace("'", '')
+        ucnetids.append(ucnetid)
+        rows.append((ucnetid, first, last, str(genders[i]), 'Yes' if first_gen[i] else 'No',
+                     'Yes' if transfer[i] else 'No', str(majors[i]), str(years[i]), int(enabled[i]), '',
+                     str(student_ids[i])))
+    conn.executemany('''INSERT INTO users (ucnetid, firstname, lastname, gender, first_generation_student, transfer_student, major, year, enabled_user, other_major, student_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    return ucnetids
+
+
+def _visits(conn, count, ucnetids, years, rng):
+    # Heavy-tailed visit counts per student: a few regulars, many occasional visitors.
+    popularity = rng.pareto(1.5, size=len(ucnetids)) + 1
+    popularity /= popularity.sum()
+    ucnetids = np.array(ucnetids, dtype=object)
+
+    now = int(time.time())
+    first_day = (now - years * 365 * 86400) // 86400
+    days = np.arange(first_day, now // 86400 + 1)
+    day_weights = WEEKDAY_WEIGHTS[(days + 3) % 7]  # 1970-01-01 was a Thursday
+    day_weights /= day_weights.sum()
+    hour_weights = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+    for start in range(0, count, CHUNK):
+        n = min(CHUNK, count - start)
+        epoch = (rng.choice(days, size=n, p=day_weights) * 86400
+                 + rng.choice(24, size=n, p=hour_weights) * 3600
+                 + rng.integers(0, 3600, size=n))
+        epoch = np.minimum(epoch, now)
+        services = sum((rng.random(n) < SERVICE_RATES[name]).astype(int) << bit
+                       for bit, name in enumerate(migrations.SERVICE_BITS))
+        uses_supplies = rng.random(n) < SUPPLY_VISIT_RATE
+        masks = sum((rng.random(n) < rate).astype(int) << bit for bit, rate in enumerate(SUPPLY_RATES))
+        masks = np.where(uses_supplies, np.maximum(masks, 1), 0)
+        who = rng.choice(ucnetids, size=n, p=popularity)
+        rows = zip(who, epoch.tolist(), services.tolist(), masks.tolist())
+        conn.executemany('INSERT INTO visits (ucnetid, ts, services, supplies) VALUES (?, ?, ?, ?)', rows)
+
+
+def _images(conn):
+    # The kiosk screens need the real banner/button images.
+    if not APP_DB.exists():
+        return
+    source = sqlite3.connect(f'file:{APP_DB}?mode=ro', uri=True)
+    try:
+        rows = source.execute('SELECT filename, data FROM binary_data').fetchall()
+    finally:
+        source.close()
+    conn.executemany('INSERT INTO binary_data (filename, data) VALUES (?, ?)', rows)
+
+
+def generate(path, users, visits, years=4, seed=1):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    for suffix in ('', '-wal', '-shm'):
+        Path(str(path) + suffix).unlink(missing_ok=True)
+
+    fake = Faker()
+    Faker.seed(seed)
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    migrations.migrate(conn)
+    _images(conn)
+    migrations.suspend_visit_rollup(conn)
+    ucnetids = _users(conn, users, fake, rng)
+    _visits(conn, visits, ucnetids, years, rng)
+    migrations.rebuild_visit_rollup(conn)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+    return path
+
+
+def fixture_path(size):
+    users, visits = SIZES[size]
+    return DATA_DIR / f'{size}_{users}u_{visits}v.db'
+
+
+def ensure(size):
+    path = fixture_path(size)
+    if not path.exists():
+        users, visits = SIZES[size]
+        generate(path, users, visits)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic sign_in.db for benchmarking.')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--users', type=int, help='override the preset user count')
+    parser.add_argument('--visits', type=int, help='override the preset visit count')
+    parser.add_argument('--years', type=int, default=4, help='spread visits over this many years')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help=f'output path (default: {DATA_DIR}/<size>_...db)')
+    args = parser.parse_args()
+
+    users, visits = SIZES[args.size]
+    users = args.users or users
+    visits = args.visits or visits
+    out = args.out or DATA_DIR / f'{args.size}_{users}u_{visits}v.db'
+    start = time.perf_counter()
+    generate(out, users, visits, args.years, args.seed)
+    print(f'{out}: {users} users, {visits} visits in {time.perf_counter() - start:.1f}s '
+          f'({os.path.getsize(out) / 2**20:.1f} MiB)')
+
+
+if __name__ == '__main__':
+    main()
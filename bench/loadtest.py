@@ -0,0 +1,312 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from bench import fixtures
+
+ROOT = Path(__file__).resolve().parent.parent
+# Share of check-ins of each kind; supplies check-ins are returning students.
+MIX = {'returning_user': 0.6, 'supplies': 0.25, 'new_user': 0.15}
+SUPPLIES = ["Printer", "3D printer", "Coffee", "Snacks", "Test materials", "Other"]
+
+
+def percentile(samples, q):
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else None
+
+
+def error_kind(error):
+    message = str(error)
+    if 'locked' in message or 'busy' in message:
+        return 'locked'
+    if 'pool exhausted' in message:
+        return 'pool_exhausted'
+    return type(error).__name__
+
+
+class RetryCounter(logging.Handler):
+    # The write-behind writer retries failed group commits in the background;
+    # count them instead of printing every traceback.
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {kind: [] for kind in MIX}
+        self.admin = []
+        self.errors = Counter()
+        self.attempts = 0
+        # Check-ins acknowledged per student, and the new users among them.
+        self.visits = Counter()
+        self.users = set()
+
+    def add(self, kind, elapsed=None, error=None, ucnetid=None, new_user=False):
+        with self.lock:
+            self.attempts += kind != 'admin'
+            if ucnetid is not None:
+                self.visits[ucnetid] += 1
+                if new_user:
+                    self.users.add(ucnetid)
+            if error is not None:
+                self.errors[error_kind(error) if kind != 'admin' else f'admin_{error_kind(error)}'] += 1
+            elif kind == 'admin':
+                self.admin.append(elapsed)
+            else:
+                self.latencies[kind].append(elapsed)
+
+
+def checkin(kind, kiosk, i, ucnetids, rng, run):
+    # One whole check-in the way the kiosk screens make it. Returns the
+    # student acknowledged and whether they were added as a new user.
+    import checkin
+    if kind == 'new_user':
+        ucnetid = f'load{run}k{kiosk}n{i}'
+        if not checkin.add_new_user(ucnetid, 'Load', f'Test{i}', 'Other', 'No', 'No', 'Computer Science', 'Junior', '',
+                                    f'{run}{kiosk:03d}{i:06d}'):
+            raise RuntimeError(f'new user {ucnetid} was refused')
+        checkin.record_transaction(ucnetid, [checkin.PURPOSES['tutor']], 0)
+        return ucnetid, True
+    ucnetid = rng.choice(ucnetids)
+    if checkin.check_user(ucnetid, '') is None:
+        raise RuntimeError(f'{ucnetid} was not found')
+    if kind == 'supplies':
+        checkin.record_transaction(ucnetid, [], checkin.check_supplies(rng.sample(SUPPLIES, rng.randint(1, 3))))
+    else:
+        checkin.record_transaction(ucnetid, rng.sample(list(checkin.PURPOSES.values()), 2), 0)
+    return ucnetid, False
+
+
+def kiosk(number, ucnetids, start_at, stop_at, think, seed, run, stats):
+    rng = random.Random(seed)
+    kinds, weights = list(MIX), list(MIX.values())
+    time.sleep(max(0.0, start_at - time.time()))
+    i = 0
+    while time.time() < stop_at:
+        kind = rng.choices(kinds, weights)[0]
+        start = time.perf_counter()
+        try:
+            ucnetid, new_user = checkin(kind, number, i, ucnetids, rng, run)
+        except Exception as e:
+            stats.add(kind, error=e)
+        else:
+            stats.add(kind, time.perf_counter() - start, ucnetid=ucnetid, new_user=new_user)
+        i += 1
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+
+def admin(start_at, stop_at, interval, stats):
+    # What a dashboard refresh reads, without rendering it.
+    import analytics
+    import db
+    import stats as dashboard_stats
+    import user_admin
+
+    cache = analytics.VisitCache()
+    time.sleep(max(0.0, start_at - time.time()))
+    while time.time() < stop_at:
+        start = time.perf_counter()
+        try:
+            with db.connection('loadtest_admin') as conn:
+                cache.refresh(conn)
+                for window in dashboard_stats.WINDOWS:
+                    cache.visitor_page(window)
+                cache.visitor_page()
+                cache.service_counts()
+                cache.supply_counts()
+                dashboard_stats.demographics(conn)
+                dashboard_stats.visits_over_time(conn, 'Day')
+                user_admin.search(conn, '', 'Enabled', 1)
+        except Exception as e:
+            stats.add('admin', error=e)
+        else:
+            stats.add('admin', time.perf_counter() - start)
+        time.sleep(interval)
+
+
+def process_main(process, kiosks, start_at, stop_at, args, run):
+    # One kiosk server: a thread per kiosk sharing the app's caches and
+    # connection pool, plus the admin in the first process.
+    sys.path.insert(0, str(ROOT))
+    import db
+    import user_index
+    import writer
+
+    with db.connection('loadtest') as conn:
+        ucnetids = [row[0] for row in conn.execute('SELECT ucnetid FROM users WHERE enabled_user = 1')]
+    user_index.get_index()
+    retries = RetryCounter()
+    writer.logger.addHandler(retries)
+    writer.logger.propagate = False
+    if writer.WRITE_BEHIND:
+        writer.get_writer()
+
+    stats = Stats()
+    threads = [threading.Thread(target=kiosk, args=(number, ucnetids, start_at, stop_at, args.think_ms / 1000,
+                                                    args.seed * 1000 + number, run, stats))
+               for number in kiosks]
+    if process == 0 and args.admin_interval > 0:
+        threads.append(threading.Thread(target=admin, args=(start_at, stop_at, args.admin_interval, stats)))
+    late = time.time() > start_at
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Write-behind acknowledgements that never reach the database count as lost.
+    flushed = writer.flush(args.flush_timeout)
+    return {'latencies': stats.latencies, 'admin': stats.admin, 'errors': dict(stats.errors),
+            'attempts': stats.attempts, 'visits': stats.visits, 'users': stats.users,
+            'writer_retries': retries.count, 'late_start': late, 'flushed': flushed}
+
+
+def last_visit(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT COALESCE(MAX(visit_id), 0) FROM visits').fetchone()[0]
+
+
+def persisted_writes(path, run, since):
+    # Visits per student written after since, and this run's new users.
+    with sqlite3.connect(path) as conn:
+        visits = Counter(dict(conn.execute('SELECT ucnetid, COUNT(*) FROM visits WHERE visit_id > ? GROUP BY ucnetid',
+                                           (since,))))
+        users = {row[0] for row in conn.execute('SELECT ucnetid FROM users WHERE ucnetid LIKE ?', (f'load{run}k%',))}
+    return {'visits': visits, 'users': users}
+
+
+def mismatched(expected, actual):
+    # What expected has that actual doesn't, student by student, so a lost
+    # check-in and a duplicated one can't cancel out.
+    return {'visits': sum((expected['visits'] - actual['visits']).values()),
+            'users': len(expected['users'] - actual['users'])}
+
+
+def report(results, duration, acknowledged, persisted):
+    latencies = {kind: sorted(sum((r['latencies'][kind] for r in results), [])) for kind in MIX}
+    every = sorted(sum(latencies.values(), []))
+    admin = sorted(sum((r['admin'] for r in results), []))
+    errors = sum((Counter(r['errors']) for r in results), Counter())
+    attempts = sum(r['attempts'] for r in results)
+
+    def summary(samples):
+        return {'n': len(samples), 'p50_ms': percentile(samples, 0.5), 'p95_ms': percentile(samples, 0.95),
+                'p99_ms': percentile(samples, 0.99)}
+
+    return {
+        'checkin': summary(every),
+        'by_kind': {kind: summary(samples) for kind, samples in latencies.items()},
+        'admin_refresh': summary(admin),
+        'throughput_per_s': len(every) / duration,
+        'errors': dict(errors),
+        'error_rate': sum(n for kind, n in errors.items() if not kind.startswith('admin_')) / attempts if attempts else 0.0,
+        'lock_error_rate': errors['locked'] / attempts if attempts else 0.0,
+        'writer_retries': sum(r['writer_retries'] for r in results),
+        'acknowledged': {'visits': sum(acknowledged['visits'].values()), 'users': len(acknowledged['users'])},
+        'persisted': {'visits': sum(persisted['visits'].values()), 'users': len(persisted['users'])},
+        'lost_writes': mismatched(acknowledged, persisted),
+        # Written more than once, or written without being acknowledged.
+        'duplicated_writes': mismatched(persisted, acknowledged),
+        'late_start': any(r['late_start'] for r in results),
+        'unflushed': not all(r['flushed'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate several kiosks and an admin dashboard against one database.')
+    parser.add_argument('--size', choices=fixtures.SIZES, default='small', help='fixture preset (generated if missing)')
+    parser.add_argument('--db', help='use this fixture instead of a preset')
+    parser.add_argument('--kiosks', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=2, help='kiosk servers; kiosks are split between them')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of load')
+    parser.add_argument('--think-ms', type=float, default=50, help='mean pause between check-ins at one kiosk')
+    parser.add_argument('--admin-interval', type=float, default=1.0, help='seconds between dashboard refreshes, 0 for none')
+    parser.add_argument('--write-behind', action='store_true', help='run the kiosks with OAI_WRITE_BEHIND=1')
+    parser.add_argument('--flush-timeout', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=5, help='seconds for the processes to import and warm up')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    args = parser.parse_args()
+
+    source = Path(args.db) if args.db else fixtures.ensure(args.size)
+    workdir = Path(tempfile.mkdtemp(prefix='oai-load-'))
+    work_db = workdir / 'sign_in.db'
+    shutil.copyfile(source, work_db)
+    # Spawned processes inherit these and read them at import time.
+    os.environ['OAI_DB'] = str(work_db)
+    os.environ['OAI_WRITE_BEHIND'] = '1' if args.write_behind else '0'
+    sys.path.insert(0, str(ROOT))
+    import migrations
+    conn = sqlite3.connect(work_db)
+    migrations.migrate(conn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.close()
+
+    run = int(time.time()) % 100000
+    processes = max(1, min(args.processes, args.kiosks))
+    before = last_visit(work_db)
+    start_at = time.time() + args.warmup
+    stop_at = start_at + args.duration
+    try:
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = [pool.submit(process_main, process, list(range(process, args.kiosks, processes)),
+                                   start_at, stop_at, args, run)
+                       for process in range(processes)]
+            results = [future.result() for future in futures]
+        persisted = persisted_writes(work_db, run, before)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    acknowledged = {'visits': sum((r['visits'] for r in results), Counter()),
+                    'users': set().union(*(r['users'] for r in results))}
+    result = {
+        'meta': {
+            'fixture': source.name,
+            'kiosks': args.kiosks,
+            'processes': processes,
+            'duration_s': args.duration,
+            'think_ms': args.think_ms,
+            'admin_interval_s': args.admin_interval,
+            'write_behind': args.write_behind,
+            'python': sys.version.split()[0],
+            'sqlite': sqlite3.sqlite_version,
+            'created': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': report(results, args.duration, acknowledged, persisted),
+    }
+    output = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + '\n')
+    else:
+        print(output)
+    summary = result['results']
+    print(f"{summary['checkin']['n']} check-ins, {summary['throughput_per_s']:.1f}/s, "
+          f"p50 {summary['checkin']['p50_ms'] or 0:.1f}ms p95 {summary['checkin']['p95_ms'] or 0:.1f}ms "
+          f"p99 {summary['checkin']['p99_ms'] or 0:.1f}ms, lock errors {summary['lock_error_rate']:.2%}, "
+          f"writer retries {summary['writer_retries']}, "
+          f"lost visits {summary['lost_writes']['visits']}, lost users {summary['lost_writes']['users']}, "
+          f"duplicated visits {summary['duplicated_writes']['visits']}, "
+          f"duplicated users {summary['duplicated_writes']['users']}",
+          file=sys.stderr)
+    failed = any(summary['lost_writes'].values()) or any(summary['duplicated_writes'].values())
+    return 1 if summary['errors'] or failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from bench import fixtures
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).parent / 'baseline.json'
+PURPOSES = ["Meet/request advice from OAI staff", "Use the OAI tutoring services", "Spend time in the OAI Wellness Corner",
+            "Hang out with friends", "Use OAI resources", "Use the study center"]
+SUPPLIES = ["Printer", "3D printer", "Coffee", "Snacks", "Test materials", "Other"]
+# Run in a fresh interpreter: the first render of the home screen, imports
+# included, and which heavy modules it pulled in.
+COLD_START = '''
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+app.run()
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'heavy': [name for name in ('pandas', 'pyarrow') if name in sys.modules]}))
+'''
+
+
+class TimedCursor(sqlite3.Cursor):
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.connection.sql_seconds += time.perf_counter() - start
+
+    def execute(self, *args):
+        return self._timed(super().execute, *args)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, *args)
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    # Splits a dashboard section's time into SQLite work and everything else
+    # (pandas, formatting) by timing every cursor call.
+    sql_seconds = 0.0
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+
+def summarize(samples, sql_samples=None):
+    samples = sorted(samples)
+    result = {
+        'n': len(samples),
+        'median_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+        'mean_ms': statistics.fmean(samples) * 1000,
+    }
+    if sql_samples is not None:
+        result['sql_ms'] = statistics.median(sql_samples) * 1000
+        result['python_ms'] = max(result['median_ms'] - result['sql_ms'], 0.0)
+    return result
+
+
+def time_calls(call, repeat, labels=()):
+    import db
+    samples, sql_samples = [], []
+    # The first call also pays for building caches and opening pool
+    # connections; like the first screen render, it is dropped.
+    call(0)
+    for i in range(1, repeat + 1):
+        before = db.timings()
+        start = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - start)
+        after = db.timings()
+        sql_samples.append(sum(after.get(label, {}).get('total_ms', 0) - before.get(label, {}).get('total_ms', 0)
+                               for label in labels) / 1000)
+    return summarize(samples, sql_samples if labels else None)
+
+
+def bench_checkin(repeat, rng):
+    import checkin
+    import writer
+    import db
+
+    with db.connection('bench') as conn:
+        ucnetids = [row[0] for row in conn.execute('SELECT ucnetid FROM users WHERE enabled_user = 1')]
+    results = {}
+    results['check_user'] = time_calls(lambda i: checkin.check_user(rng.choice(ucnetids), ''), repeat, ['check_user'])
+    results['check_supplies'] = time_calls(
+        lambda i: checkin.check_supplies(rng.sample(SUPPLIES, rng.randint(1, 3))), repeat)
+    results['record_transaction'] = time_calls(
+        lambda i: checkin.record_transaction(rng.choice(ucnetids), rng.sample(PURPOSES, 2), 0), repeat,
+        ['record_transaction'])
+    stamp = int(time.time())
+    results['add_new_user'] = time_calls(
+        lambda i: checkin.add_new_user(f'bench{stamp}x{i}', 'Bench', 'User', 'Other', 'No', 'No',
+                                       'Computer Science', 'Junior', '', f'b{stamp}{i}'), repeat, ['add_new_user'])
+    writer.flush()
+    return results
+
+
+def bench_dashboard(path, repeat):
+    import analytics
+    import snapshots
+    import stats
+    import user_admin
+
+    conn = sqlite3.connect(path, factory=TimedConnection)
+    today = date.today()
+    visits = analytics.VisitCache()
+    report_cache = snapshots.SnapshotCache()
+    sections = {
+        'visit_cache_load': lambda: analytics.VisitCache().refresh(conn),
+        'visit_cache_refresh': lambda: visits.refresh(conn),
+        'demographics': lambda: stats.demographics(conn),
+        'service_counts': lambda: visits.service_counts(),
+        'supply_counts': lambda: visits.supply_counts(),
+        'visits_over_time_day': lambda: stats.visits_over_time(conn, 'Day'),
+        # A refresh first, so the window tables are cut again as on a dashboard render.
+        'visitor_windows': lambda: (visits.refresh(conn), [visits.visitor_page(window) for window in stats.WINDOWS]),
+        'all_time_visitors': lambda: (visits.refresh(conn), visits.visitor_page()),
+        'user_page': lambda: user_admin.search(conn, '', 'Enabled', 1),
+        'user_search': lambda: user_admin.search(conn, 'mar', 'All', 1),
+        'date_range_semester': lambda: stats.date_range_report(conn, today - timedelta(days=120), today),
+        'date_range_semester_snapshots': lambda: snapshots.date_range_report(conn, today - timedelta(days=120), today,
+                                                                             report_cache),
+    }
+    results = {}
+    for name, section in sections.items():
+        samples, sql_samples = [], []
+        for _ in range(repeat):
+            conn.sql_seconds = 0.0
+            start = time.perf_counter()
+            section()
+            samples.append(time.perf_counter() - start)
+            sql_samples.append(conn.sql_seconds)
+        results[f'dashboard.{name}'] = summarize(samples, sql_samples)
+    conn.close()
+    return results
+
+
+def bench_screens(repeat):
+    from streamlit.testing.v1 import AppTest
+
+    screens = {
+        'home': {},
+        'new_user': {'user_type': 'new_user'},
+        'returning_user': {'user_type': 'returning_user'},
+        'dashboard': {'user_type': 'dashboard', 'logged_in': True},
+    }
+    results = {}
+    for name, state in screens.items():
+        samples = []
+        # The first render also pays for imports and cache warm-up; drop it.
+        for attempt in range(repeat + 1):
+            app = AppTest.from_file(str(ROOT / 'oai.py'), default_timeout=600)
+            for key, value in state.items():
+                app.session_state[key] = value
+            start = time.perf_counter()
+            app.run()
+            if app.exception:
+                raise RuntimeError(f'{name} screen raised: {app.exception[0].message}')
+            if attempt:
+                samples.append(time.perf_counter() - start)
+        results[f'screen.{name}'] = summarize(samples)
+    return results
+
+
+def bench_cold_start(repeat):
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', COLD_START, str(ROOT / 'oai.py')], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result['seconds'])
+    summary = summarize(samples)
+    summary['heavy_imports'] = result['heavy']
+    return {'startup.home_cold': summary}
+
+
+def compare(results, baseline, tolerance, floor_ms):
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get('results', {}).get(name)
+        if not base:
+            continue
+        ratio = result['median_ms'] / base['median_ms'] if base['median_ms'] else float('inf')
+        if ratio > 1 + tolerance and result['median_ms'] - base['median_ms'] > floor_ms:
+            regressions.append((name, base['median_ms'], result['median_ms'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark check-in and dashboard hot paths against a synthetic DB.')
+    parser.add_argument('--size', choices=fixtures.SIZES, default='small', help='fixture preset (generated if missing)')
+    parser.add_argument('--db', help='use this fixture instead of a preset')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--screen-repeat', type=int, default=5)
+    parser.add_argument('--skip-screens', action='store_true', help='skip the AppTest full-page renders')
+    parser.add_argument('--out', help='write results JSON here (default: stdout)')
+    parser.add_argument('--baseline', default=str(BASELINE))
+    parser.add_argument('--save-baseline', action='store_true', help='overwrite the baseline with these results')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown before failing, as a ratio')
+    parser.add_argument('--floor-ms', type=float, default=1.0, help='ignore slowdowns smaller than this')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    source = Path(args.db) if args.db else fixtures.ensure(args.size)
+    workdir = Path(tempfile.mkdtemp(prefix='oai-bench-'))
+    work_db = workdir / 'sign_in.db'
+    shutil.copyfile(source, work_db)
+    # The app modules read OAI_DB at import time, so this must come first.
+    os.environ['OAI_DB'] = str(work_db)
+    sys.path.insert(0, str(ROOT))
+    rng = random.Random(args.seed)
+    # Fixtures generated before the latest migrations are brought up to date
+    # here, so the migration itself isn't timed as part of any section.
+    import migrations
+    conn = sqlite3.connect(work_db)
+    migrations.migrate(conn)
+    conn.close()
+
+    try:
+        results = {}
+        results.update(bench_dashboard(work_db, args.repeat))
+        results.update(bench_checkin(args.repeat, rng))
+        if not args.skip_screens:
+            results.update(bench_cold_start(args.screen_repeat))
+            results.update(bench_screens(args.screen_repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with sqlite3.connect(source) as conn:
+        users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        visits = conn.execute('SELECT COUNT(*) FROM transaction_log').fetchone()[0]
+    report = {
+        'meta': {
+            'fixture': source.name,
+            'users': users,
+            'visits': visits,
+            'repeat': args.repeat,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.platform(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + '\n')
+    else:
+        print(output)
+
+    if args.save_baseline:
+        Path(args.baseline).write_text(output + '\n')
+        return 0
+    if not Path(args.baseline).exists():
+        return 0
+    baseline = json.loads(Path(args.baseline).read_text())
+    if baseline['meta'].get('fixture') != source.name:
+        print(f"baseline was recorded on {baseline['meta'].get('fixture')}, not comparing", file=sys.stderr)
+        return 0
+    for name in sorted(set(results) - set(baseline['results'])):
+        print(f'no baseline for {name}, not compared; rerun with --save-baseline', file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+    for name, before, after, ratio in regressions:
+        print(f'REGRESSION {name}: {before:.2f}ms -> {after:.2f}ms ({ratio:.2f}x)', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
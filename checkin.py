@@ -0,0 +1,70 @@
+import sqlite3
+import time
+
+import db
+import migrations
+import supply_resolver
+import user_index
+import writer
+
+# Check-in form purpose -> visits.services bit.
+PURPOSES = {
+    'advice': "Meet/request advice from OAI staff",
+    'tutor': "Use the OAI tutoring services",
+    'wellness_corner': "Spend time in the OAI Wellness Corner",
+    'hangout': "Hang out with friends",
+    'study_center': "Use the study center",
+}
+
+
+def check_user(ucnetid,student_id):
+    index = user_index.get_index()
+    user = index.lookup(ucnetid, student_id)
+    if user is not None:
+        return user
+    with db.connection('check_user') as connection:
+        cursor = connection.cursor()
+        cursor.execute(f'''SELECT {user_index.USER_COLUMNS} FROM users
+                          WHERE (ucnetid = ? AND enabled_user = 1) OR (student_id = ? AND enabled_user = 1)''',
+                       (ucnetid, user_index.student_key(student_id)))
+        user = cursor.fetchone()
+    if user is not None:
+        index.add(user)
+    return user
+
+
+def check_supplies(supplies):
+    return supply_resolver.supply_mask(supplies)
+
+
+def add_new_user(ucnetid, firstname, lastname, gender, first_gen, transfer_student, major, year,other_major,student_id):
+    row = (ucnetid, firstname, lastname, gender, first_gen, transfer_student, major, year, 1, other_major, student_id)
+    if writer.active():
+        checkin_writer = writer.get_writer()
+        with db.connection('add_new_user') as connection:
+            exists = connection.execute('SELECT 1 FROM users WHERE ucnetid = ?', (ucnetid,)).fetchone()
+        if exists or checkin_writer.pending_user(ucnetid):
+            return False
+        checkin_writer.submit('user', row)
+        user_index.get_index().add(row)
+        return True
+    try:
+        with db.connection('add_new_user') as connection:
+            cursor = connection.cursor()
+            cursor.execute('''INSERT INTO users (ucnetid, firstname, lastname, gender, first_generation_student, transfer_student, major, year, enabled_user, other_major,student_id) 
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?,?,?)''', 
+                              row)
+    except sqlite3.IntegrityError:
+        return False
+    user_index.get_index().add(row)
+    return True
+
+
+def record_transaction(ucnetid, purpose, supplies):
+    services = sum(1 << bit for bit, column in enumerate(migrations.SERVICE_BITS) if PURPOSES[column] in purpose)
+    if writer.active():
+        writer.get_writer().submit('checkin', (ucnetid, services, supplies, int(time.time())))
+        return
+    with db.connection('record_transaction') as connection:
+        connection.execute('INSERT INTO visits (ucnetid, services, supplies) VALUES (?, ?, ?)',
+                           (ucnetid, services, supplies))
@@ -0,0 +1,394 @@
+import csv
+import io
+from datetime import datetime
+from math import ceil
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+import analytics
+import db
+import export
+import profiler
+import roster
+import snapshots
+import stats
+import user_admin
+import user_index
+import writer
+from kiosk import handle_restart
+
+def reset_user_page():
+    st.session_state['user_page'] = 1
+
+def update_selected_users(enabled):
+    table = st.session_state.get(f"user_table_{st.session_state.get('user_table_version', 0)}")
+    page_ids = st.session_state.get('user_page_ids', [])
+    ucnetids = [page_ids[row] for row in table.selection.rows if row < len(page_ids)] if table else []
+    if not ucnetids:
+        st.session_state['user_update'] = ('warning', "Select users in the table first.")
+        return
+    changed = user_admin.set_enabled(ucnetids, enabled)
+    # A new table key clears the selection on the re-queried page.
+    st.session_state['user_table_version'] = st.session_state.get('user_table_version', 0) + 1
+    st.session_state['user_update'] = ('success', f"{'Enabled' if enabled else 'Disabled'} {len(changed)} of {len(ucnetids)} selected users.")
+
+@st.fragment
+def user_management():
+    with profiler.fragment("User management"), db.connection('user_management') as conn:
+        roster_import(conn)
+        user_management_page(conn)
+
+def roster_import(conn):
+    with st.expander("Import roster"):
+        uploaded = st.file_uploader(f"Roster CSV ({', '.join(roster.COLUMNS)})", type='csv', key='roster_file')
+        sync_users = st.checkbox("Also enable everyone in the roster and disable users missing from it", key='roster_sync')
+        if not st.button("Import", disabled=uploaded is None):
+            return
+        # Progress follows how far into the upload the CSV reader has got.
+        bar = st.progress(0.0, "Importing...")
+        progress = lambda rows: bar.progress(min(uploaded.tell() / max(uploaded.size, 1), 1.0), f"{rows} rows")
+        try:
+            result = roster.sync(conn, io.TextIOWrapper(uploaded, encoding='utf-8-sig', newline=''), sync_users, progress)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            st.error(f"Could not import {uploaded.name}: {e}")
+            return
+        user_index.get_index().refresh(force=True)
+        # A new table key drops the selection, which may point at changed rows.
+        st.session_state['user_table_version'] = st.session_state.get('user_table_version', 0) + 1
+        st.success(f"{result.rows} rows: {result.inserted} added, {result.updated} updated, {result.unchanged} unchanged, "
+                   f"{len(result.enabled)} enabled, {len(result.disabled)} disabled, {result.skipped} skipped.")
+        if result.errors:
+            st.dataframe(pd.DataFrame(result.errors, columns=['Line', 'Problem']), hide_index=True)
+
+def user_management_page(conn):
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        search = st.text_input("Search by name or ucnetid", key='user_search', on_change=reset_user_page)
+    with col2:
+        status = st.selectbox("Show", list(user_admin.STATUS_FILTERS), key='user_status', on_change=reset_user_page)
+
+    page = st.session_state.get('user_page', 1)
+    df, total = user_admin.search(conn, search, status, page)
+    pages = max(1, ceil(total / user_admin.PAGE_SIZE))
+    if page > pages:
+        st.session_state['user_page'] = page = pages
+        df, total = user_admin.search(conn, search, status, page)
+
+    if df.empty:
+        st.write("No users match.")
+        return
+    st.session_state['user_page_ids'] = df['UCNetID'].tolist()
+    st.dataframe(df, key=f"user_table_{st.session_state.get('user_table_version', 0)}", on_select='rerun',
+                 selection_mode='multi-row', hide_index=True, use_container_width=True)
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        st.number_input(f"Page of {pages} ({total} users)", min_value=1, max_value=pages, key='user_page')
+    with col2:
+        st.button("Disable selected", on_click=update_selected_users, args=(0,))
+    with col3:
+        st.button("Enable selected", on_click=update_selected_users, args=(1,))
+    update = st.session_state.pop('user_update', None)
+    if update:
+        kind, message = update
+        getattr(st, kind)(message)
+
+@st.fragment
+def performance_panel():
+    enabled = st.toggle("Record queries", value=profiler.ENABLED,
+                        help="Profiles every query this server runs, kiosks included, which slows them down. "
+                             "OAI_PROFILE=1 turns it on at startup.")
+    if enabled != profiler.ENABLED:
+        profiler.set_enabled(enabled)
+    if not enabled:
+        st.write("Profiling is off.")
+        return
+    runs = [run for run in profiler.PROFILER.runs() if run['status'] != 'running']
+    queries = pd.DataFrame(profiler.PROFILER.queries())
+    if not runs or queries.empty:
+        st.write("Nothing recorded yet. Use the dashboard and come back to this tab.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("Export JSONL", profiler.PROFILER.to_jsonl(), file_name="oai-profile.jsonl",
+                           mime="application/jsonl")
+    with col2:
+        if st.button("Clear recordings"):
+            profiler.PROFILER.clear()
+            st.rerun()
+
+    st.write("### Reruns")
+    runs_df = pd.DataFrame([{
+        'Run': run['run'], 'Screen': run['screen'], 'Status': run['status'],
+        'Started': datetime.fromtimestamp(run['started']).strftime('%H:%M:%S'),
+        'Total ms': run['ms'], 'SQL ms': run['sql_ms'], 'Other ms': run['ms'] - run['sql_ms'],
+        'Queries': run['queries'], 'Rows': run['rows'],
+    } for run in reversed(runs)])
+    st.dataframe(runs_df, hide_index=True, use_container_width=True)
+
+    by_id = {run['run']: run for run in runs}
+    run_id = st.selectbox("Rerun", list(by_id)[::-1], format_func=lambda r: f"#{r} {by_id[r]['screen']} ({by_id[r]['ms']:.0f} ms)")
+    run = by_id[run_id]
+    if run['sections']:
+        st.write("Sections (time not spent in SQL is pandas and rendering)")
+        st.dataframe(pd.DataFrame([{
+            'Section': name, 'Total ms': s['ms'], 'SQL ms': s['sql_ms'], 'Render ms': s['ms'] - s['sql_ms'],
+            'Queries': s['queries'],
+        } for name, s in run['sections'].items()]).sort_values('Total ms', ascending=False),
+            hide_index=True, use_container_width=True)
+    run_queries = queries[queries['run'] == run_id]
+    st.dataframe(run_queries[['section', 'sql', 'ms', 'rows', 'vm_steps', 'statements', 'plan']]
+                 .sort_values('ms', ascending=False), hide_index=True, use_container_width=True)
+
+    st.write("### Queries since start")
+    queries['full_scan'] = queries['scans'].map(bool)
+    summary = queries.groupby('sql').agg(calls=('ms', 'size'), total_ms=('ms', 'sum'), mean_ms=('ms', 'mean'),
+                                         max_ms=('ms', 'max'), rows=('rows', 'mean'),
+                                         full_scan=('full_scan', 'first'), plan=('plan', 'first'))
+    st.dataframe(summary.sort_values('total_ms', ascending=False).reset_index(), hide_index=True,
+                 use_container_width=True)
+
+    st.write("### Connection time by caller")
+    st.dataframe(pd.DataFrame.from_dict(db.timings(), orient='index').sort_values('total_ms', ascending=False),
+                 use_container_width=True)
+
+# Only the selected view runs on a rerun. Widgets inside a view sit in
+# fragments, so changing one reruns just its part of the view.
+VIEWS = ["Dashboard", "User Management", "Performance", "Date Range"]
+
+def dashboard():
+    # Make check-ins still sitting in the write-behind queue visible first.
+    writer.flush()
+    checkin_time = db.timings().get('checkin_success')
+    if checkin_time:
+        st.caption(f"Average check-in time {checkin_time['mean_ms'] / 1000:.1f}s over {checkin_time['calls']} check-ins since the kiosk started.")
+    view = st.radio("View", VIEWS, horizontal=True, key='dashboard_view', label_visibility='collapsed')
+
+    if view == "Dashboard":
+        statistics()
+    elif view == "User Management":
+        st.subheader("Manage Users")
+        user_management()
+    elif view == "Performance":
+        performance_panel()
+    else:
+        date_range()
+
+def statistics():
+    with db.connection('dashboard') as conn:
+        st.subheader("General Statistics")
+        col1, col2 = st.columns(2)
+
+        with col1, profiler.section("General statistics"):
+            people = stats.demographics(conn)
+            st.write(f"There are {people.total} users.")
+
+            if not people.major.empty:
+                st.write(f"The most popular major is {people.major.index[0]} with {people.major.iloc[0]} students.")
+
+            if not people.year.empty:
+                st.write(f"The most popular year is {people.year.index[0]} with {people.year.iloc[0]} students.")
+
+            yes_first_gen = people.first_gen.get("Yes", 0)
+            no_first_gen = people.first_gen.get("No", 0)
+            st.write(f"{no_first_gen} students are not first-generation students. {yes_first_gen} students are first-generation students.")
+
+            yes_transfer = people.transfer.get("Yes", 0)
+            no_transfer = people.transfer.get("No", 0)
+            st.write(f"{yes_transfer} students are transfer students. {no_transfer} students are not transfer students.")
+
+            if not people.gender.empty:
+                st.write(", ".join(f"{count} {gender}" for gender, count in people.gender.items()) + " students.")
+
+            with st.expander("Major by year"):
+                st.dataframe(people.major_by_year)
+            with st.expander("First-generation by transfer"):
+                st.dataframe(people.first_gen_by_transfer.rename_axis(index="First gen", columns="Transfer"))
+
+        with col2:
+            with profiler.section("Visit cache"):
+                visits = analytics.get_cache()
+                visits.refresh(conn)
+            st.write("### Past hour")
+            visitor_table("Past hour")
+
+            st.write("### Past 5 hours")
+            visitor_table("Past 5 hours")
+
+            for period in ("Past week", "Past month"):
+                with st.expander(period):
+                    visitor_table(period)
+
+            with st.expander("All Time"):
+                all_time_visitors()
+
+            st.write("### Services Usage:")
+            with profiler.section("Services usage"):
+                service_dict = visits.service_counts()
+
+                service_df = pd.DataFrame(list(service_dict.items()), columns=['Service', 'Count'])
+                service_df = service_df.sort_values(by='Count', ascending=False)
+                st.bar_chart(service_df.set_index('Service'))
+
+            st.write("### Most Used Supplies:")
+            with profiler.section("Most used supplies"):
+                supplies_dict = visits.supply_counts()
+
+                supplies_df = pd.DataFrame(list(supplies_dict.items()), columns=['Supply', 'Count'])
+                supplies_df = supplies_df.sort_values(by='Count', ascending=False)
+                st.bar_chart(supplies_df.set_index('Supply'))
+
+            st.write("### Visits over time:")
+            visits_over_time()
+
+def reset_visitor_pages(key):
+    st.session_state[f'{key}_pages'] = [None]
+
+def previous_visitor_page(key):
+    st.session_state[f'{key}_pages'].pop()
+
+def next_visitor_page(key, after):
+    st.session_state[f'{key}_pages'].append(after)
+
+def visitor_table_page(window):
+    # One aggregated row per visitor, fetched a page at a time: the keys of
+    # the pages so far are kept so Previous can step back.
+    key = f"visitors_{window or 'all_time'}".replace(' ', '_').lower()
+    with profiler.fragment(window or "All Time"):
+        # Refreshed once by statistics(); page clicks only read it.
+        visits = analytics.get_cache()
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            sort = st.selectbox("Sort by", list(analytics.VISITOR_SORTS), key=f'{key}_sort',
+                                on_change=reset_visitor_pages, args=(key,))
+        with col2:
+            descending = st.toggle("Descending", value=True, key=f'{key}_descending',
+                                   on_change=reset_visitor_pages, args=(key,))
+        pages = st.session_state.setdefault(f'{key}_pages', [None])
+        df, after, total = visits.visitor_page(window, sort, descending, pages[-1])
+        if df.empty and len(pages) > 1:
+            # The table shrank under the saved page; start over.
+            reset_visitor_pages(key)
+            pages = st.session_state[f'{key}_pages']
+            df, after, total = visits.visitor_page(window, sort, descending)
+
+        if df.empty:
+            st.write("No data available for this period.")
+            return
+        st.dataframe(df, hide_index=True, use_container_width=True, column_config={
+            'First Visit': st.column_config.DatetimeColumn(format="MM/DD/YY hh:mm a"),
+            'Last Visit': st.column_config.DatetimeColumn(format="MM/DD/YY hh:mm a"),
+        })
+        col1, col2, col3 = st.columns([2, 1, 1])
+        with col1:
+            first = (len(pages) - 1) * analytics.VISITOR_PAGE
+            st.caption(f"Visitors {first + 1}-{first + len(df)} of {total}")
+        with col2:
+            st.button("Previous", key=f'{key}_previous', disabled=len(pages) == 1,
+                      on_click=previous_visitor_page, args=(key,))
+        with col3:
+            st.button("Next", key=f'{key}_next', disabled=after is None,
+                      on_click=next_visitor_page, args=(key, after))
+
+@st.fragment
+def visitor_table(window):
+    visitor_table_page(window)
+
+@st.fragment
+def all_time_visitors():
+    # Every visitor ever, archived months included, so only on request.
+    if st.toggle("Show all-time visitors", key='show_all_time'):
+        visitor_table_page(None)
+
+@st.fragment
+def visits_over_time():
+    grain = st.radio("Group by", list(stats.GRAINS), index=1, horizontal=True, key='visits_grain')
+    with profiler.fragment("Visits over time"), db.connection('visits_over_time') as conn:
+        st.bar_chart(stats.visits_over_time(conn, grain))
+
+@st.fragment
+def date_range():
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start Date", min_value=datetime(2020, 1, 1), value=datetime(2024, 9, 27))
+    with col2:
+        end_date = st.date_input("End Date", min_value=start_date)
+
+    if start_date > end_date:
+        st.error("Start Date cannot be later than End Date. Please select valid dates.")
+    else:
+        with st.expander("Export"):
+            export_format = st.radio("Format", list(export.FORMATS), horizontal=True, key='export_format')
+            extension, mime = export.FORMATS[export_format]
+            if st.button("Prepare export"):
+                with db.connection('export') as conn:
+                    visits = stats.date_range_count(conn, start_date, end_date)
+                if visits > export.MAX_DOWNLOAD_ROWS:
+                    st.warning(f"{visits} visits is more than the {export.MAX_DOWNLOAD_ROWS} a download here can hold. "
+                               f"Pick a shorter range, or on the server run: "
+                               f"python export.py {start_date} {end_date} oai_visits.{extension}")
+                else:
+                    # Rows are streamed from SQLite into a temp file chunk by chunk.
+                    with st.spinner("Exporting..."):
+                        path, rows = export.export_to_tempfile(start_date, end_date, export_format)
+                    try:
+                        data = Path(path).read_bytes()
+                    finally:
+                        Path(path).unlink()
+                    st.download_button(f"Download {rows} visits", data, mime=mime,
+                                       file_name=f"oai_visits_{start_date}_{end_date}.{extension}")
+
+        with profiler.fragment("Date range"):
+            with db.connection('date_range') as conn:
+                # Closed months and days come from report snapshots; only today is queried.
+                df = snapshots.date_range_report(conn, start_date, end_date)
+
+            if not df.empty:
+                st.table(df)
+            else:
+                st.write("No data available for the selected date range.")
+
+def page():
+    # Imported and shown only once the dashboard button is pressed.
+    st.markdown("""
+        <style>
+        #MainMenu {visibility:hidden;}
+        footer {visibility:hidden;}
+    
+        div.block-container {padding-top:0rem;}
+        button[title="View fullscreen"]{
+    visibility: hidden;}
+
+    .block-container {padding-top:3rem ;padding-bottom:0rem;}
+    /* Remove blank space at the center canvas */ 
+           .st-emotion-cache-z5fcl4 {
+               position: relative;
+               top: -65px;
+               }
+    
+       
+       
+        </style>
+    """, unsafe_allow_html=True)
+    if not st.session_state.get('logged_in', False):  
+        st.write("")
+        st.write("")
+        with st.form("login_form"):
+            password = st.text_input("Enter the password", type='password')  
+            submit_button = st.form_submit_button("Submit", type="primary")
+        
+            if submit_button and password == '1234':  
+                st.session_state['logged_in'] = True
+                st.session_state['user_type'] = 'dashboard' 
+                st.rerun() 
+            elif submit_button:
+                st.error("Incorrect password. Please try again.")
+    else: 
+        st.write("")
+        st.write("")
+        st.header("Dashboard")
+        st.button("CHECKIN HOME", on_click=handle_restart)
+    
+        dashboard()  
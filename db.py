@@ -0,0 +1,132 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import streamlit as st
+
+import archive
+import migrations
+import profiler
+
+DB_PATH = os.environ.get('OAI_DB', 'sign_in.db')
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE = 256
+ACQUIRE_TIMEOUT = 10
+
+
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._recent = deque(maxlen=500)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE,
+                               factory=profiler.ProfiledConnection if profiler.ENABLED else sqlite3.Connection)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        return conn
+
+    def _stale(self, conn):
+        # Opened before profiling was switched on or off.
+        return isinstance(conn, profiler.ProfiledConnection) != profiler.ENABLED
+
+    def _discard(self, conn):
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if not self._stale(conn):
+                return conn
+            self._discard(conn)
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            conn = self._idle.get(timeout=ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            raise sqlite3.OperationalError('connection pool exhausted')
+        if self._stale(conn):
+            self._discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._stale(conn):
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def record(self, label, elapsed):
+        with self._lock:
+            count, total, worst = self._stats.get(label, (0, 0.0, 0.0))
+            self._stats[label] = (count + 1, total + elapsed, max(worst, elapsed))
+            self._recent.append((time.time(), label, elapsed))
+
+    def timings(self):
+        with self._lock:
+            return {label: {'calls': count, 'total_ms': total * 1000, 'mean_ms': total * 1000 / count,
+                            'max_ms': worst * 1000}
+                    for label, (count, total, worst) in self._stats.items()}
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool():
+    pool = ConnectionPool(DB_PATH)
+    conn = pool.acquire()
+    try:
+        migrations.migrate(conn)
+        archive.upgrade_partitions(conn)
+    finally:
+        pool.release(conn)
+    return pool
+
+
+@contextmanager
+def connection(label='query'):
+    pool = get_pool()
+    conn = pool.acquire()
+    start = time.perf_counter()
+    try:
+        yield conn
+        if conn.in_transaction:
+            conn.commit()
+    finally:
+        pool.record(label, time.perf_counter() - start)
+        pool.release(conn)
+
+
+def record(label, elapsed):
+    get_pool().record(label, elapsed)
+
+
+def timings():
+    return get_pool().timings()
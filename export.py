@@ -0,0 +1,86 @@
+import argparse
+import csv
+import os
+import tempfile
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import db
+import stats
+
+CHUNK_ROWS = 50_000
+# st.download_button keeps the whole file in memory for the session, so the
+# dashboard only offers ranges up to this many visits. Larger ones go through
+# this script, which writes straight to disk.
+MAX_DOWNLOAD_ROWS = 250_000
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+PARQUET_SCHEMA = pa.schema([
+    ('Timestamp', pa.timestamp('s')),
+    ('Email', pa.string()),
+    ('First Name', pa.string()),
+    ('Last Name', pa.string()),
+    ('Purpose', pa.string()),
+])
+
+
+def write_csv(chunks, path):
+    rows = 0
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(PARQUET_SCHEMA.names)
+        for chunk in chunks:
+            writer.writerows(chunk.itertuples(index=False, name=None))
+            rows += len(chunk)
+    return rows
+
+
+def write_parquet(chunks, path):
+    # One row group per chunk, so only a chunk's worth of rows is ever in memory.
+    rows = 0
+    with pq.ParquetWriter(path, PARQUET_SCHEMA, compression='zstd') as out:
+        for chunk in chunks:
+            if len(chunk):
+                out.write_table(pa.Table.from_pandas(chunk, schema=PARQUET_SCHEMA, preserve_index=False))
+            rows += len(chunk)
+    return rows
+
+
+def export_date_range(start_date, end_date, fmt, path, chunk_rows=CHUNK_ROWS):
+    extension, _ = FORMATS[fmt]
+    with db.connection('export') as conn:
+        if extension == 'csv':
+            return write_csv(stats.date_range_chunks(conn, start_date, end_date, chunk_rows), path)
+        return write_parquet(stats.date_range_chunks(conn, start_date, end_date, chunk_rows, False), path)
+
+
+def export_to_tempfile(start_date, end_date, fmt):
+    # The caller reads the file for st.download_button and deletes it.
+    extension, _ = FORMATS[fmt]
+    handle, path = tempfile.mkstemp(prefix='oai-date-range-', suffix=f'.{extension}')
+    os.close(handle)
+    try:
+        rows = export_date_range(start_date, end_date, fmt, path)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the Date Range report without going through the dashboard.')
+    parser.add_argument('start', type=date.fromisoformat, help='first day, YYYY-MM-DD')
+    parser.add_argument('end', type=date.fromisoformat, help='last day (inclusive), YYYY-MM-DD')
+    parser.add_argument('out', help='output file; .parquet writes Parquet, anything else CSV')
+    args = parser.parse_args()
+    fmt = 'Parquet' if args.out.endswith('.parquet') else 'CSV'
+    rows = export_date_range(args.start, args.end, fmt, args.out)
+    print(f'{args.out}: {rows} visits')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+import time
+
+import streamlit as st
+
+import assets
+import db
+import profiler
+import user_index
+import writer
+from checkin import check_user, check_supplies, add_new_user, record_transaction
+
+# The check-in screens rerun on every tap, so nothing here imports pandas or
+# pyarrow; the dashboard module does, and is only imported when it is shown.
+
+@st.cache_resource(show_spinner=False)
+def startup():
+    # One-time setup per kiosk process: migrations, the user index, resized
+    # images and the write-behind thread. Later reruns only pay for the cache
+    # lookup.
+    db.get_pool()
+    user_index.get_index()
+    assets.get_assets()
+    if writer.WRITE_BEHIND:
+        writer.get_writer()
+    return True
+
+def layout():
+    # Page config and CSS have to be sent again on every rerun.
+    st.set_page_config(page_title="OAI", layout="wide")
+
+    st.markdown("""
+        <style>
+        #MainMenu {visibility:hidden;}
+        footer {visibility:hidden;}
+        
+        div.block-container {padding-top:0rem;}
+        button[title="View fullscreen"]{
+    visibility: hidden;}
+    
+    .block-container {padding-top:0rem ;padding-bottom:0rem;}
+    /* Remove blank space at the center canvas */ 
+           .st-emotion-cache-z5fcl4 {
+               position: relative;
+               top: -62px;
+               }
+        
+           
+           
+        </style>
+    """, unsafe_allow_html=True)
+
+@st.dialog("Error")
+def error_message(message):
+    st.write(message)
+
+
+def handle_restart():
+    st.session_state['user_type'] = None
+    st.session_state['purpose'] = None
+    st.session_state['supplies_form'] = None
+    st.session_state['logged_in'] = False
+    st.rerun()
+
+def finish_checkin(kind, message, seconds=3):
+    # Reset the kiosk straight away and leave the outcome on screen for a few
+    # seconds instead of sleeping on the script thread.
+    started = st.session_state.pop('checkin_started', None)
+    if started is not None:
+        db.record(f'checkin_{kind}', time.perf_counter() - started)
+    st.toast(message)
+    st.session_state['notice'] = (kind, message, time.time() + seconds)
+    handle_restart()
+
+def notice_banner():
+    notice = st.session_state.get('notice')
+    if notice:
+        st.fragment(show_notice, run_every=1)()
+
+def show_notice():
+    kind, message, until = st.session_state.get('notice') or (None, None, 0)
+    if time.time() >= until:
+        st.session_state['notice'] = None
+        st.rerun()
+    elif kind == 'error':
+        st.error(message)
+    else:
+        st.success(message)
+
+@st.dialog("Supplies")
+def supplies_form(ucnetid, purpose):
+    with st.form('Supplies Form'):
+        supplies = st.multiselect("Select supplies you are here for:", ["Printer", "3D printer", "Coffee", "Snacks", "Test materials", "Other"])
+        other = st.text_input("Other supplies you're using.")
+        submit_button = st.form_submit_button("Submit")
+        
+        if submit_button:
+            if not supplies:
+                st.error("Please select at least one supply.")
+            else:
+                record_transaction(ucnetid, purpose, check_supplies(supplies))
+                finish_checkin('success', 'Submitted, thanks')
+
+#@st.dialog(title='New user',width='large')    
+def new_user_form():
+    with st.form('new_user'):
+        ucnetid = st.text_input("Enter your UCI email")
+        ucnetid = ucnetid.lower()
+        student_id = '...................'
+        st.session_state['ucnetid'] = ucnetid
+        firstname = st.text_input("Enter your first name")
+        lastname = st.text_input("Enter your last name")
+        gender = st.selectbox("Gender", ["Male", "Female", "Other"], index=None,placeholder="Gender")
+        first_gen = st.selectbox("Are you a first-generation student?", ["Yes", "No"], index=None,placeholder="First Generation")
+        transfer_student = st.selectbox("Are you a transfer student?", ["Yes", "No"], index=None,placeholder="Transfer")
+        major = st.selectbox("Select your major", [
+            "Mechanical Engineering", "Electrical Engineering", "Computer Science", 
+            "Civil Engineering", "Bioengineering", "Chemical Engineering", 
+            "Materials Science", "Aerospace Engineering", "Software Engineering", 
+            "Environmental Engineering", "Engineering Physics", "Other"
+        ], index=None,placeholder="Major")
+        other_major = st.text_input("Enter other major not in Engineering")
+        year = st.selectbox("Select your year", ["Freshman", "Sophomore", "Junior", "Senior", "Graduate"], index=None,placeholder="Year")
+
+        purpose = st.multiselect("What is the purpose of your visit?", 
+                                 ["Meet/request advice from OAI staff", "Use the OAI tutoring services", "Spend time in the OAI Wellness Corner", "Hang out with friends", "Use OAI resources", "Use the study center"]
+)
+        st.session_state['purpose'] = purpose
+        submit_button = st.form_submit_button("Submit")
+    
+        if submit_button:
+            if not ucnetid or not firstname or not lastname or not major or not purpose:
+                st.error("All fields are required.")
+                error_message("All fields are required.")
+                st.toast("All fields are required.")
+            else:
+                user = check_user(ucnetid,student_id)
+                success = add_new_user(ucnetid, firstname, lastname, gender, first_gen, transfer_student, major, year,other_major,student_id)
+                if not success or user:
+                    finish_checkin('error', f"UCNetID {ucnetid} is already registered. Please go to returning user form.", 5)
+                else:
+                        st.write(f'New user {firstname} {lastname} added successfully')
+                        if "Use OAI resources" in purpose:
+                            st.toast("Please enter your chosen supplies")
+                            st.session_state['supplies_form'] = True
+                            # The supplies dialog is opened by the full script, not this fragment.
+                            st.rerun()
+                        else:
+                            st.session_state['supplies_form'] = False
+                            record_transaction(ucnetid, purpose, 0)
+                            finish_checkin('success', f'New user {firstname} {lastname} added successfully')
+
+# Typing and submitting only rerun the form's fragment; finish_checkin's
+# st.rerun() still reruns the whole app back to the home screen.
+@st.fragment
+def new_user():
+    with profiler.fragment("New user form"):
+        new_user_form()
+
+#@st.dialog(title='Returning user',width='large')                        
+def use_suggestion(ucnetid):
+    st.session_state['returning_ucnetid'] = ucnetid
+
+@st.fragment
+def ucnetid_lookup():
+    # Outside the form, in a fragment of its own, so the ucnetid is checked
+    # against the user index as soon as it is entered without rerunning the
+    # form around it.
+    ucnetid = st.text_input("Enter your ucnetid email(Example: sahr3824@uci.edu). Don't use your student id", key='returning_ucnetid')
+    if ucnetid:
+        known = check_user(ucnetid, ucnetid)
+        if known:
+            st.caption(f"Checking in as {known[1]} {known[2]}.")
+        else:
+            suggestions = user_index.get_index().suggest(ucnetid)
+            if suggestions:
+                st.caption("We don't recognize that ucnetid. Did you mean:")
+                for col, suggestion in zip(st.columns(len(suggestions)), suggestions):
+                    col.button(suggestion, key=f'suggest_{suggestion}', on_click=use_suggestion, args=(suggestion,))
+            else:
+                st.caption("We don't recognize that ucnetid.")
+
+def returning_user_form():
+    ucnetid_lookup()
+    ucnetid = st.session_state.get('returning_ucnetid', '')
+
+    with st.form('returning user'):
+        st.session_state['ucnetid'] = ucnetid
+        purpose = st.multiselect("What is the purpose of your visit? (CHECK ALL THAT APPLY)", 
+                                 ["Meet/request advice from OAI staff", "Use the OAI tutoring services", "Spend time in the OAI Wellness Corner", "Hang out with friends", "Use OAI resources", "Use the study center"])
+        st.session_state['purpose'] = purpose
+        submit_button = st.form_submit_button("Submit")
+        
+        if submit_button:
+            if not purpose or not ucnetid:
+                st.error("All fields are required.")
+                st.toast("All fields are required.")
+            else:
+                user = check_user(ucnetid,ucnetid)
+                st.session_state['purpose'] = purpose
+                if user and user[-1] == 0:  
+                    finish_checkin('error', f"Your account (UCNetID: {ucnetid}) is disabled. Please contact support.")
+                elif not user:
+                    finish_checkin('error', "We don't recognize you. Please go to 'checkin home' to the new user form or contact support.")
+
+                else:
+                    st.success(f"Welcome back {user[1]} {user[2]}, please proceed.")
+                    if "Use OAI resources" not in purpose:
+                        st.session_state['supplies_form'] = False
+                        record_transaction(ucnetid, purpose, 0)
+                        finish_checkin('success', f"Welcome back {user[1]} {user[2]}, please proceed.")
+                    else:
+                        st.session_state['supplies_form'] = True
+                        st.rerun()
+
+@st.fragment
+def returning_user():
+    with profiler.fragment("Returning user form"):
+        returning_user_form()
+
+def new_user_click():
+    st.session_state['user_type'] = 'new_user'
+    st.session_state['checkin_started'] = time.perf_counter()
+
+def returning_user_click():
+    st.session_state['user_type'] = 'returning_user'
+    st.session_state['checkin_started'] = time.perf_counter()
+
+def dashboard_click():
+    st.session_state['user_type'] = 'dashboard'
+
+def read_image(filename, width=None):
+    return assets.get_assets().image(filename, width)
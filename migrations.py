@@ -0,0 +1,605 @@
+def _baseline(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS "users"  (
+	"ucnetid"	TEXT,
+	"firstname"	TEXT,
+	"lastname"	TEXT,
+	"gender"	TEXT,
+	"first_generation_student"	TEXT,
+	"transfer_student"	TEXT,
+	"major"	TEXT,
+	"year"	TEXT,
+	"enabled_user"	INTEGER,
+	"other_major"	TEXT,
+	"student_id"	TEXT,
+	PRIMARY KEY("ucnetid")
+);''')
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    for column in ('other_major', 'student_id'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE users ADD COLUMN "{column}" TEXT')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS "supplies" (
+    "supply_id" INTEGER,
+    "printing_paper" INTEGER,
+    "printing_3d" INTEGER,
+    "testing_supplies" INTEGER,
+    "coffee" INTEGER,
+    "snacks" INTEGER,
+    "other" TEXT,
+    PRIMARY KEY("supply_id" AUTOINCREMENT)
+);''')
+
+    conn.execute('''INSERT INTO supplies (printing_paper, printing_3d, testing_supplies, coffee, snacks, other)
+SELECT 0, 0, 0, 0, 0, 0
+WHERE NOT EXISTS (SELECT 1 FROM supplies WHERE supply_id = 1);
+''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS "transaction_log"  (
+	"visit_id"	INTEGER,
+	"ucnetid"	TEXT,
+	"timestamp"	NUMERIC DEFAULT CURRENT_TIMESTAMP,
+	"supply_id"	INTEGER,
+	"advice"	INTEGER,
+	"tutor"	INTEGER,
+	"wellness_corner"	INTEGER,
+	"hangout"	INTEGER,
+	"study_center"	INTEGER,
+	FOREIGN KEY("ucnetid") REFERENCES "users"("ucnetid"),
+	PRIMARY KEY("visit_id" AUTOINCREMENT)
+);''')
+
+
+def _fix_transaction_log_fk(conn):
+    # Older databases still point transaction_log at the long-gone "usersolddata"
+    # table; SQLite can't alter a foreign key, so the table is rebuilt.
+    targets = {row[2] for row in conn.execute('PRAGMA foreign_key_list(transaction_log)')}
+    if targets == {'users'}:
+        return
+    conn.execute('''CREATE TABLE "transaction_log_new"  (
+	"visit_id"	INTEGER,
+	"ucnetid"	TEXT,
+	"timestamp"	NUMERIC DEFAULT CURRENT_TIMESTAMP,
+	"supply_id"	INTEGER,
+	"advice"	INTEGER,
+	"tutor"	INTEGER,
+	"wellness_corner"	INTEGER,
+	"hangout"	INTEGER,
+	"study_center"	INTEGER,
+	FOREIGN KEY("ucnetid") REFERENCES "users"("ucnetid"),
+	PRIMARY KEY("visit_id" AUTOINCREMENT)
+);''')
+    conn.execute('''INSERT INTO transaction_log_new (visit_id, ucnetid, timestamp, supply_id, advice, tutor, wellness_corner, hangout, study_center)
+                    SELECT visit_id, ucnetid, timestamp, supply_id, advice, tutor, wellness_corner, hangout, study_center
+                    FROM transaction_log''')
+    conn.execute('DROP TABLE transaction_log')
+    conn.execute('ALTER TABLE transaction_log_new RENAME TO transaction_log')
+
+
+def _indexes(conn):
+    # Dashboard windows filter on timestamp and join on ucnetid.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transaction_log_timestamp ON transaction_log (timestamp, ucnetid)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transaction_log_ucnetid ON transaction_log (ucnetid)')
+    # check_user's OR lookup needs both sides indexed to avoid a scan.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_student_id ON users (student_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_enabled_user ON users (enabled_user)')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_supplies_flags
+                    ON supplies (printing_paper, printing_3d, testing_supplies, coffee, snacks, other)''')
+    conn.execute('ANALYZE')
+
+
+def _binary_data_version(conn):
+    # Bumped by triggers so the in-memory asset cache can tell when images change
+    # without re-reading the blobs.
+    conn.execute('''CREATE TABLE IF NOT EXISTS "binary_data" (
+	"id"	INTEGER,
+	"filename"	TEXT,
+	"data"	BLOB,
+	PRIMARY KEY("id" AUTOINCREMENT)
+)''')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)')
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('binary_data_version', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS binary_data_{event.lower()}_version
+                         AFTER {event} ON binary_data
+                         BEGIN
+                             UPDATE meta SET value = value + 1 WHERE key = 'binary_data_version';
+                         END''')
+
+
+ROLLUP_COUNTERS = ['visits', 'advice', 'tutor', 'wellness_corner', 'hangout', 'study_center',
+                   'supply_visits', 'printing_paper', 'printing_3d', 'testing_supplies', 'coffee', 'snacks', 'other']
+
+_LEGACY_NEW_VISIT = ('(SELECT NEW.timestamp AS timestamp, NEW.ucnetid AS ucnetid, NEW.supply_id AS supply_id, '
+                     'NEW.advice AS advice, NEW.tutor AS tutor, NEW.wellness_corner AS wellness_corner, '
+                     'NEW.hangout AS hangout, NEW.study_center AS study_center)')
+_LEGACY_OLD_VISIT = _LEGACY_NEW_VISIT.replace('NEW.', 'OLD.')
+
+
+def _legacy_rollup_upsert(visits, sign=1, enabled='COALESCE(u.enabled_user = 1, 0)', where='1'):
+    # Adds (or with sign=-1 removes) the given transaction_log-format visits
+    # to their hourly buckets; rollup_upsert is the same for visits rows.
+    # Visits by disabled or unknown users land in the enabled = 0 bucket so the
+    # all-users supply totals still include them.
+    updates = ', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_COUNTERS)
+    return f'''INSERT INTO visit_rollup (hour, enabled, {', '.join(ROLLUP_COUNTERS)})
+        SELECT strftime('%Y-%m-%d %H:00:00', t.timestamp), {enabled},
+               {sign} * COUNT(*),
+               {sign} * SUM(COALESCE(t.advice, 0)),
+               {sign} * SUM(COALESCE(t.tutor, 0)),
+               {sign} * SUM(COALESCE(t.wellness_corner, 0)),
+               {sign} * SUM(COALESCE(t.hangout, 0)),
+               {sign} * SUM(COALESCE(t.study_center, 0)),
+               {sign} * SUM(s.supply_id IS NOT NULL AND s.supply_id != 1),
+               {sign} * SUM(COALESCE(s.printing_paper, 0)),
+               {sign} * SUM(COALESCE(s.printing_3d, 0)),
+               {sign} * SUM(COALESCE(s.testing_supplies, 0)),
+               {sign} * SUM(COALESCE(s.coffee, 0)),
+               {sign} * SUM(COALESCE(s.snacks, 0)),
+               {sign} * SUM(COALESCE(CAST(s.other AS INTEGER), 0))
+        FROM {visits} t
+        LEFT JOIN users u ON u.ucnetid = t.ucnetid
+        LEFT JOIN supplies s ON s.supply_id = t.supply_id
+        WHERE {where}
+        GROUP BY 1, 2
+        ON CONFLICT (hour, enabled) DO UPDATE SET {updates};'''
+
+
+def _visit_rollup(conn):
+    counters = ',\n'.join(f'    {c} INTEGER NOT NULL DEFAULT 0' for c in ROLLUP_COUNTERS)
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS visit_rollup (
+    hour TEXT NOT NULL,
+    enabled INTEGER NOT NULL,
+{counters},
+    PRIMARY KEY (hour, enabled)
+) WITHOUT ROWID''')
+    conn.execute('DELETE FROM visit_rollup')
+    conn.execute(_legacy_rollup_upsert('transaction_log'))
+    _legacy_rollup_triggers(conn)
+
+
+def _legacy_rollup_triggers(conn):
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS transaction_log_rollup_insert
+                     AFTER INSERT ON transaction_log
+                     BEGIN
+                         {_legacy_rollup_upsert(_LEGACY_NEW_VISIT)}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS transaction_log_rollup_delete
+                     AFTER DELETE ON transaction_log
+                     BEGIN
+                         {_legacy_rollup_upsert(_LEGACY_OLD_VISIT, sign=-1)}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS transaction_log_rollup_update
+                     AFTER UPDATE OF timestamp, ucnetid, supply_id, advice, tutor, wellness_corner, hangout, study_center
+                     ON transaction_log
+                     BEGIN
+                         {_legacy_rollup_upsert(_LEGACY_OLD_VISIT, sign=-1)}
+                         {_legacy_rollup_upsert(_LEGACY_NEW_VISIT)}
+                     END''')
+
+    # Enabling or disabling a user moves all of their visits between buckets.
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_enabled
+                     AFTER UPDATE OF enabled_user ON users
+                     WHEN (OLD.enabled_user = 1) IS NOT (NEW.enabled_user = 1)
+                     BEGIN
+                         {_legacy_rollup_upsert('transaction_log', -1, 'COALESCE(OLD.enabled_user = 1, 0)', 't.ucnetid = NEW.ucnetid')}
+                         {_legacy_rollup_upsert('transaction_log', 1, 'COALESCE(NEW.enabled_user = 1, 0)', 't.ucnetid = NEW.ucnetid')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_insert
+                     AFTER INSERT ON users
+                     WHEN NEW.enabled_user = 1
+                     BEGIN
+                         {_legacy_rollup_upsert('transaction_log', -1, '0', 't.ucnetid = NEW.ucnetid')}
+                         {_legacy_rollup_upsert('transaction_log', 1, '1', 't.ucnetid = NEW.ucnetid')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_delete
+                     AFTER DELETE ON users
+                     WHEN OLD.enabled_user = 1
+                     BEGIN
+                         {_legacy_rollup_upsert('transaction_log', -1, '1', 't.ucnetid = OLD.ucnetid')}
+                         {_legacy_rollup_upsert('transaction_log', 1, '0', 't.ucnetid = OLD.ucnetid')}
+                     END''')
+
+
+SUPPLY_COLUMNS = 'printing_paper, printing_3d, testing_supplies, coffee, snacks, other'
+
+
+def _unique_supplies(conn):
+    # Concurrent check_supplies calls could insert the same combination twice.
+    # Point every visit at the oldest row for its combination, drop the rest,
+    # and make the combination unique so it can't happen again.
+    conn.execute(f'''CREATE TEMP TABLE supply_remap AS
+                     SELECT s.supply_id AS old_id, keep.supply_id AS new_id
+                     FROM supplies s
+                     JOIN (SELECT MIN(supply_id) AS supply_id, {SUPPLY_COLUMNS}
+                           FROM supplies
+                           GROUP BY {SUPPLY_COLUMNS}) keep
+                       ON s.printing_paper IS keep.printing_paper
+                      AND s.printing_3d IS keep.printing_3d
+                      AND s.testing_supplies IS keep.testing_supplies
+                      AND s.coffee IS keep.coffee
+                      AND s.snacks IS keep.snacks
+                      AND s.other IS keep.other
+                     WHERE s.supply_id != keep.supply_id''')
+    conn.execute('''UPDATE transaction_log
+                    SET supply_id = (SELECT new_id FROM supply_remap WHERE old_id = transaction_log.supply_id)
+                    WHERE supply_id IN (SELECT old_id FROM supply_remap)''')
+    conn.execute('DELETE FROM supplies WHERE supply_id IN (SELECT old_id FROM supply_remap)')
+    conn.execute('DROP TABLE supply_remap')
+    conn.execute('DROP INDEX IF EXISTS idx_supplies_flags')
+    conn.execute(f'CREATE UNIQUE INDEX idx_supplies_flags ON supplies ({SUPPLY_COLUMNS})')
+
+
+def _applied_writes(conn):
+    # Ids of journaled check-ins already committed by the write-behind writer,
+    # so replaying its journal after a crash never inserts a visit twice.
+    conn.execute('CREATE TABLE IF NOT EXISTS applied_writes (op_id TEXT PRIMARY KEY) WITHOUT ROWID')
+
+
+def _archive_manifest(conn):
+    # One row per month moved out of transaction_log into its own SQLite file
+    # (path is relative to the main database's directory).
+    conn.execute('''CREATE TABLE IF NOT EXISTS archive_partitions (
+    month TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    first_timestamp TEXT NOT NULL,
+    last_timestamp TEXT NOT NULL,
+    visits INTEGER NOT NULL,
+    archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID''')
+
+
+def _users_version(conn):
+    # Bumped when a user row changes or goes away, so in-memory user lookups in
+    # other kiosk processes know to reload. New rows don't bump it: a lookup
+    # miss already falls back to the database.
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('users_version', 0)")
+    for event in ('UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_{event.lower()}_version
+                         AFTER {event} ON users
+                         BEGIN
+                             UPDATE meta SET value = value + 1 WHERE key = 'users_version';
+                         END''')
+
+
+def _users_search(conn):
+    # Full-text index over the user management search fields, kept in step
+    # with users by triggers. It is keyed by the users rowid, so run
+    # INSERT INTO users_fts(users_fts) VALUES ('rebuild') after any VACUUM.
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS users_fts
+                    USING fts5(ucnetid, firstname, lastname, content='users', content_rowid='rowid',
+                               tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    insert = '''INSERT INTO users_fts (rowid, ucnetid, firstname, lastname)
+                  VALUES (NEW.rowid, NEW.ucnetid, NEW.firstname, NEW.lastname);'''
+    delete = '''INSERT INTO users_fts (users_fts, rowid, ucnetid, firstname, lastname)
+                  VALUES ('delete', OLD.rowid, OLD.ucnetid, OLD.firstname, OLD.lastname);'''
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN {insert} END')
+    conn.execute(f'CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN {delete} END')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF ucnetid, firstname, lastname ON users
+                     BEGIN {delete} {insert} END''')
+    conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    # Unfiltered pages are listed by name.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_name ON users (lastname, firstname, ucnetid)')
+
+
+def _visitor_index(conn):
+    # Per-user visit counts and last visits read straight off this index;
+    # it also covers everything the ucnetid-only index did.
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_transaction_log_ucnetid_timestamp ON transaction_log (ucnetid, timestamp)')
+    conn.execute('DROP INDEX IF EXISTS idx_transaction_log_ucnetid')
+    conn.execute('ANALYZE')
+
+
+# Bit positions in visits.services and visits.supplies.
+SERVICE_BITS = ['advice', 'tutor', 'wellness_corner', 'hangout', 'study_center']
+SUPPLY_BITS = SUPPLY_COLUMNS.split(', ')
+EPOCH_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+NEW_VISIT = '(SELECT NEW.ucnetid AS ucnetid, NEW.ts AS ts, NEW.services AS services, NEW.supplies AS supplies)'
+OLD_VISIT = NEW_VISIT.replace('NEW.', 'OLD.')
+
+
+def _flag_mask(flags):
+    # SQL for a bitmask from (expression, bit) pairs holding 0/1 flags.
+    return ' | '.join(f'((COALESCE({expr}, 0) = 1) << {bit})' for expr, bit in flags)
+
+
+def services_mask(row):
+    return _flag_mask((f'{row}.{column}', bit) for bit, column in enumerate(SERVICE_BITS))
+
+
+def supplies_mask(row):
+    return _flag_mask((f'CAST({row}.{column} AS INTEGER)' if column == 'other' else f'{row}.{column}', bit)
+                      for bit, column in enumerate(SUPPLY_BITS))
+
+
+def _bit(mask, bit):
+    return f'(({mask} >> {bit}) & 1)'
+
+
+def rollup_upsert(visits, sign=1, enabled='COALESCE(u.enabled_user = 1, 0)', where='1'):
+    # Adds (or with sign=-1 removes) the given visits to their hourly buckets.
+    # Visits by disabled or unknown users land in the enabled = 0 bucket so the
+    # all-users supply totals still include them.
+    updates = ', '.join(f'{c} = {c} + excluded.{c}' for c in ROLLUP_COUNTERS)
+    services = ''.join(f',\n               {sign} * SUM({_bit("t.services", bit)})' for bit in range(len(SERVICE_BITS)))
+    supplies = ''.join(f',\n               {sign} * SUM({_bit("t.supplies", bit)})' for bit in range(len(SUPPLY_BITS)))
+    return f'''INSERT INTO visit_rollup (hour, enabled, {', '.join(ROLLUP_COUNTERS)})
+        SELECT strftime('%Y-%m-%d %H:00:00', t.ts, 'unixepoch'), {enabled},
+               {sign} * COUNT(*){services},
+               {sign} * SUM(t.supplies != 0){supplies}
+        FROM {visits} t
+        LEFT JOIN users u ON u.ucnetid = t.ucnetid
+        WHERE {where}
+        GROUP BY 1, 2
+        ON CONFLICT (hour, enabled) DO UPDATE SET {updates};'''
+
+
+def create_rollup_triggers(conn):
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_rollup_insert
+                     AFTER INSERT ON visits
+                     BEGIN
+                         {rollup_upsert(NEW_VISIT)}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_rollup_delete
+                     AFTER DELETE ON visits
+                     BEGIN
+                         {rollup_upsert(OLD_VISIT, sign=-1)}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_rollup_update
+                     AFTER UPDATE OF ucnetid, ts, services, supplies ON visits
+                     BEGIN
+                         {rollup_upsert(OLD_VISIT, sign=-1)}
+                         {rollup_upsert(NEW_VISIT)}
+                     END''')
+
+    # Enabling or disabling a user moves all of their visits between buckets.
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_enabled
+                     AFTER UPDATE OF enabled_user ON users
+                     WHEN (OLD.enabled_user = 1) IS NOT (NEW.enabled_user = 1)
+                     BEGIN
+                         {rollup_upsert('visits', -1, 'COALESCE(OLD.enabled_user = 1, 0)', 't.ucnetid = NEW.ucnetid')}
+                         {rollup_upsert('visits', 1, 'COALESCE(NEW.enabled_user = 1, 0)', 't.ucnetid = NEW.ucnetid')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_insert
+                     AFTER INSERT ON users
+                     WHEN NEW.enabled_user = 1
+                     BEGIN
+                         {rollup_upsert('visits', -1, '0', 't.ucnetid = NEW.ucnetid')}
+                         {rollup_upsert('visits', 1, '1', 't.ucnetid = NEW.ucnetid')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_rollup_delete
+                     AFTER DELETE ON users
+                     WHEN OLD.enabled_user = 1
+                     BEGIN
+                         {rollup_upsert('visits', -1, '1', 't.ucnetid = OLD.ucnetid')}
+                         {rollup_upsert('visits', 1, '0', 't.ucnetid = OLD.ucnetid')}
+                     END''')
+
+
+ROLLUP_TRIGGERS = ['visits_rollup_insert', 'visits_rollup_delete', 'visits_rollup_update',
+                   'users_rollup_enabled', 'users_rollup_insert', 'users_rollup_delete']
+
+
+def suspend_visit_rollup(conn):
+    # Bulk loads drop the per-row triggers and call rebuild_visit_rollup() after.
+    for trigger in ROLLUP_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+
+def rebuild_visit_rollup(conn):
+    # Only counts the live table; archive.rebuild_rollup() also adds archived months.
+    conn.execute('DELETE FROM visit_rollup')
+    conn.execute(rollup_upsert('visits'))
+    create_rollup_triggers(conn)
+
+
+def _compact_visits(conn):
+    # Visits move to an integer epoch plus one bitmask for services and one
+    # for supplies (bits in SERVICE_BITS / SUPPLY_BITS order). transaction_log
+    # becomes a view over it with the old columns, writable through INSTEAD OF
+    # triggers, so old queries and journaled check-ins keep working.
+    conn.execute(f'''CREATE TABLE visits (
+    visit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ucnetid TEXT REFERENCES users (ucnetid),
+    ts INTEGER DEFAULT ({EPOCH_NOW}),
+    services INTEGER NOT NULL DEFAULT 0,
+    supplies INTEGER NOT NULL DEFAULT 0
+)''')
+    # Every combination gets a supplies row so the view's supply_id is never NULL.
+    flags = ', '.join(f"CAST({_bit('mask', bit)} AS TEXT)" if column == 'other' else _bit('mask', bit)
+                      for bit, column in enumerate(SUPPLY_BITS))
+    conn.execute(f'''WITH RECURSIVE masks (mask) AS (SELECT 0 UNION ALL SELECT mask + 1 FROM masks WHERE mask < 63)
+                     INSERT INTO supplies ({SUPPLY_COLUMNS})
+                     SELECT {flags} FROM masks WHERE true
+                     ON CONFLICT DO NOTHING''')
+
+    conn.execute(f'''INSERT INTO visits (visit_id, ucnetid, ts, services, supplies)
+                     SELECT t.visit_id, t.ucnetid, CAST(strftime('%s', t.timestamp) AS INTEGER),
+                            {services_mask('t')}, {supplies_mask('s')}
+                     FROM transaction_log t
+                     LEFT JOIN supplies s ON s.supply_id = t.supply_id
+                     ORDER BY t.visit_id''')
+    # Archived visits took ids too; never hand them out again.
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'visits'")
+    conn.execute("""INSERT INTO sqlite_sequence (name, seq)
+                    SELECT 'visits', seq FROM sqlite_sequence WHERE name = 'transaction_log'""")
+    for trigger in ('users_rollup_enabled', 'users_rollup_insert', 'users_rollup_delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    conn.execute('DROP TABLE transaction_log')
+
+    supply_match = ' AND '.join(
+        f"s.{column} = CAST({_bit('v.supplies', bit)} AS TEXT)" if column == 'other' else f"s.{column} = {_bit('v.supplies', bit)}"
+        for bit, column in enumerate(SUPPLY_BITS))
+    services = ', '.join(f"{_bit('v.services', bit)} AS {column}" for bit, column in enumerate(SERVICE_BITS))
+    conn.execute(f'''CREATE VIEW transaction_log AS
+                     SELECT v.visit_id AS visit_id,
+                            v.ucnetid AS ucnetid,
+                            datetime(v.ts, 'unixepoch') AS timestamp,
+                            (SELECT MIN(s.supply_id) FROM supplies s WHERE {supply_match}) AS supply_id,
+                            {services}
+                     FROM visits v''')
+    new_values = f'''NEW.ucnetid,
+                    COALESCE(CAST(strftime('%s', NEW.timestamp) AS INTEGER), {EPOCH_NOW}),
+                    {services_mask('NEW')},
+                    COALESCE((SELECT {supplies_mask('s')} FROM supplies s WHERE s.supply_id = NEW.supply_id), 0)'''
+    conn.execute(f'''CREATE TRIGGER transaction_log_insert INSTEAD OF INSERT ON transaction_log
+                     BEGIN
+                         INSERT INTO visits (visit_id, ucnetid, ts, services, supplies)
+                         VALUES (NEW.visit_id, {new_values});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER transaction_log_update INSTEAD OF UPDATE ON transaction_log
+                     BEGIN
+                         UPDATE visits SET (visit_id, ucnetid, ts, services, supplies) = (NEW.visit_id, {new_values})
+                         WHERE visit_id = OLD.visit_id;
+                     END''')
+    conn.execute('''CREATE TRIGGER transaction_log_delete INSTEAD OF DELETE ON transaction_log
+                    BEGIN
+                        DELETE FROM visits WHERE visit_id = OLD.visit_id;
+                    END''')
+
+    conn.execute('CREATE INDEX idx_visits_ts ON visits (ts, ucnetid)')
+    conn.execute('CREATE INDEX idx_visits_ucnetid_ts ON visits (ucnetid, ts)')
+    create_rollup_triggers(conn)
+    # Partitions archived before this are converted by archive.upgrade_partitions().
+    conn.execute('ALTER TABLE archive_partitions ADD COLUMN format INTEGER NOT NULL DEFAULT 1')
+    conn.execute('ANALYZE')
+
+
+def _visits_version(conn):
+    # Bumped when a visit is edited or deleted (archiving included), so the
+    # dashboard's in-memory visit cache knows to reload instead of appending.
+    conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('visits_version', 0)")
+    for event in ('UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_{event.lower()}_version
+                         AFTER {event} ON visits
+                         BEGIN
+                             UPDATE meta SET value = value + 1 WHERE key = 'visits_version';
+                         END''')
+
+
+def _image_variants(conn):
+    # Resized kiosk images keyed by the source image's sha256, so a new kiosk
+    # process doesn't have to resize them again.
+    conn.execute('''CREATE TABLE IF NOT EXISTS image_variants (
+    digest TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (digest, width)
+) WITHOUT ROWID''')
+
+
+def _drop_snapshot(visit):
+    # A day of the current month and, once it closes, the whole month can
+    # both have snapshots, so every one covering the visit goes.
+    return f'''DELETE FROM report_snapshots
+               WHERE end_ts > {visit}.ts AND start_ts <= {visit}.ts;'''
+
+
+def create_snapshot_triggers(conn):
+    # Any change to a visit drops the report snapshot covering its timestamp.
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_snapshot_insert
+                     AFTER INSERT ON visits
+                     BEGIN
+                         {_drop_snapshot('NEW')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_snapshot_delete
+                     AFTER DELETE ON visits
+                     BEGIN
+                         {_drop_snapshot('OLD')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS visits_snapshot_update
+                     AFTER UPDATE ON visits
+                     BEGIN
+                         {_drop_snapshot('OLD')}
+                         {_drop_snapshot('NEW')}
+                     END''')
+
+
+def _report_snapshots(conn):
+    # Manifest of Date Range report snapshots: one Parquet file per closed
+    # month, or per closed day of the current month. A row without a path is
+    # a build in progress; the triggers delete those too, which tells the
+    # builder its file is already stale.
+    conn.execute('''CREATE TABLE IF NOT EXISTS report_snapshots (
+    start_ts INTEGER PRIMARY KEY,
+    end_ts INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    path TEXT,
+    visits INTEGER,
+    token TEXT NOT NULL,
+    built_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+)''')
+    create_snapshot_triggers(conn)
+
+
+def _report_snapshot_periods(conn):
+    # A closed month starts when its first day does, so snapshots are keyed
+    # by their whole period. The triggers are recreated for the new table.
+    for event in ('insert', 'delete', 'update'):
+        conn.execute(f'DROP TRIGGER IF EXISTS visits_snapshot_{event}')
+    conn.execute('''CREATE TABLE report_snapshots_new (
+    start_ts INTEGER NOT NULL,
+    end_ts INTEGER NOT NULL,
+    period TEXT NOT NULL,
+    path TEXT,
+    visits INTEGER,
+    token TEXT NOT NULL,
+    built_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (start_ts, end_ts)
+) WITHOUT ROWID''')
+    conn.execute('''INSERT INTO report_snapshots_new (start_ts, end_ts, period, path, visits, token, built_at)
+                    SELECT start_ts, end_ts, period, path, visits, token, built_at FROM report_snapshots''')
+    conn.execute('DROP TABLE report_snapshots')
+    conn.execute('ALTER TABLE report_snapshots_new RENAME TO report_snapshots')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_report_snapshots_end_ts ON report_snapshots (end_ts)')
+    create_snapshot_triggers(conn)
+
+
+
+def _applied_writes_journal(conn):
+    # Every writer process has its own journal, so each clears only the ids
+    # it wrote. Ids from before then belong to the old shared journal ('').
+    conn.execute("ALTER TABLE applied_writes ADD COLUMN journal TEXT NOT NULL DEFAULT ''")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_applied_writes_journal ON applied_writes (journal)')
+
+
+MIGRATIONS = [
+    (1, _baseline),
+    (2, _fix_transaction_log_fk),
+    (3, _indexes),
+    (4, _binary_data_version),
+    (5, _visit_rollup),
+    (6, _unique_supplies),
+    (7, _applied_writes),
+    (8, _archive_manifest),
+    (9, _users_version),
+    (10, _users_search),
+    (11, _visitor_index),
+    (12, _compact_visits),
+    (13, _visits_version),
+    (14, _image_variants),
+    (15, _report_snapshots),
+    (16, _report_snapshot_periods),
+    (17, _applied_writes_journal),
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    if schema_version(conn) >= MIGRATIONS[-1][0]:
+        return
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Re-read under the write lock in case another kiosk process got here first.
+        current = schema_version(conn)
+        for version, step in MIGRATIONS:
+            if version > current:
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
@@ -0,0 +1,286 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Off by default: a profiled connection adds a trace callback, a progress
+# handler and an EXPLAIN per new statement to every query. The Performance
+# view can switch it on for a running server.
+ENABLED = os.environ.get('OAI_PROFILE', '0') == '1'
+MAX_QUERIES = 5000
+MAX_RUNS = 500
+# The progress handler fires every this many SQLite VM instructions.
+PROGRESS_STEPS = 1000
+PLANNED = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+
+class Profiler:
+    # Keeps the most recent query and rerun records in memory. Records are
+    # plain dicts so the Performance tab and the JSONL export can use them
+    # as they are.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = deque(maxlen=MAX_QUERIES)
+        self._runs = deque(maxlen=MAX_RUNS)
+        self._plans = {}
+        self._local = threading.local()
+        self._next_run = 0
+
+    def start_run(self, screen):
+        # st.rerun() unwinds the script before it reaches end_run, so an open
+        # run on this thread is closed off here instead.
+        self.end_run('interrupted')
+        with self._lock:
+            self._next_run += 1
+            run = {'run': self._next_run, 'screen': screen, 'started': time.time(), 'ms': None,
+                   'sql_ms': 0.0, 'queries': 0, 'rows': 0, 'status': 'running', 'sections': {}}
+            self._runs.append(run)
+        self._local.run = run
+        self._local.run_start = time.perf_counter()
+        self._local.sections = []
+
+    def end_run(self, status='done'):
+        run = getattr(self._local, 'run', None)
+        if run is None:
+            return
+        run['ms'] = (time.perf_counter() - self._local.run_start) * 1000
+        run['status'] = status
+        self._local.run = None
+
+    @contextmanager
+    def section(self, name):
+        # Time spent in a section that is not SQL is pandas and rendering.
+        run = getattr(self._local, 'run', None)
+        stack = getattr(self._local, 'sections', None)
+        if run is None or stack is None:
+            yield
+            return
+        stack.append(name)
+        entry = run['sections'].setdefault(name, {'ms': 0.0, 'sql_ms': 0.0, 'queries': 0})
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry['ms'] += (time.perf_counter() - start) * 1000
+            stack.pop()
+
+    @contextmanager
+    def fragment(self, name):
+        # A fragment rerun executes just the fragment function, not the script
+        # around it, so it gets a run record of its own. During a full run it
+        # is only another section.
+        if getattr(self._local, 'run', None) is not None:
+            with self.section(name):
+                yield
+            return
+        self.start_run(f'fragment: {name}')
+        try:
+            with self.section(name):
+                yield
+        except BaseException:
+            self.end_run('interrupted')
+            raise
+        self.end_run()
+
+    def begin_query(self, conn, sql):
+        run = getattr(self._local, 'run', None)
+        stack = getattr(self._local, 'sections', None)
+        record = {
+            'at': time.time(),
+            'run': run['run'] if run else None,
+            'section': stack[-1] if stack else None,
+            'sql': ' '.join(sql.split()),
+            'ms': 0.0,
+            'rows': 0,
+            'vm_steps': 0,
+            'statements': 0,
+        }
+        record.update(self.plan(conn, sql))
+        with self._lock:
+            self._queries.append(record)
+        if run:
+            run['queries'] += 1
+            if record['section']:
+                run['sections'][record['section']]['queries'] += 1
+        return record
+
+    def add_time(self, record, elapsed, rows=0):
+        ms = elapsed * 1000
+        record['ms'] += ms
+        record['rows'] += rows
+        run = getattr(self._local, 'run', None)
+        if run and run['run'] == record['run']:
+            run['sql_ms'] += ms
+            run['rows'] += rows
+            if record['section']:
+                run['sections'][record['section']]['sql_ms'] += ms
+
+    def plan(self, conn, sql):
+        # EXPLAIN QUERY PLAN once per distinct statement text; the plan only
+        # changes when the schema or ANALYZE statistics do.
+        key = ' '.join(sql.split())
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        plan = {'plan': '', 'scans': []}
+        if key.split(' ', 1)[0].upper() in PLANNED:
+            try:
+                details = [row[3] for row in conn.explain(sql)]
+            except sqlite3.Error:
+                details = []
+            plan = {
+                'plan': '; '.join(details),
+                'scans': sorted({d.split()[1] for d in details if d.startswith('SCAN ') and len(d.split()) > 1}),
+            }
+        self._plans[key] = plan
+        return plan
+
+    def queries(self):
+        with self._lock:
+            return [dict(q) for q in self._queries]
+
+    def runs(self):
+        with self._lock:
+            return [dict(r, sections={k: dict(v) for k, v in r['sections'].items()}) for r in self._runs]
+
+    def clear(self):
+        with self._lock:
+            self._queries.clear()
+            self._runs.clear()
+
+    def to_jsonl(self):
+        lines = [json.dumps(dict(run, type='run')) for run in self.runs()]
+        lines += [json.dumps(dict(query, type='query')) for query in self.queries()]
+        return '\n'.join(lines) + '\n'
+
+
+PROFILER = Profiler()
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    _record = None
+
+    def _call(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        if self._record is not None:
+            rows = len(result) if isinstance(result, list) else int(result is not None)
+            PROFILER.add_time(self._record, time.perf_counter() - start, rows)
+        return result
+
+    def _begin(self, method, sql, *args):
+        record = PROFILER.begin_query(self.connection, sql)
+        self._record = None
+        self.connection._current = record
+        start = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            PROFILER.add_time(record, time.perf_counter() - start)
+            self._record = record
+
+    def execute(self, sql, *args):
+        return self._begin(super().execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._begin(super().executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._begin(super().executescript, sql)
+
+    def fetchone(self):
+        return self._call(super().fetchone)
+
+    def fetchmany(self, *args):
+        return self._call(super().fetchmany, *args)
+
+    def fetchall(self):
+        return self._call(super().fetchall)
+
+    def __next__(self):
+        row = self._call(super().fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class ProfiledConnection(sqlite3.Connection):
+    # Pool connections are created with this factory when profiling is on.
+    # Cursor wrappers time execute and fetch calls and count rows; the trace
+    # callback counts statements SQLite actually ran (including COMMITs) and
+    # the progress handler counts VM work for the query in flight.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._current = None
+        self._explaining = False
+        self.set_trace_callback(self._trace)
+        self.set_progress_handler(self._progress, PROGRESS_STEPS)
+
+    def _trace(self, statement):
+        if self._current is not None and not self._explaining:
+            self._current['statements'] += 1
+
+    def _progress(self):
+        if self._current is not None and not self._explaining:
+            self._current['vm_steps'] += PROGRESS_STEPS
+        return 0
+
+    def explain(self, sql):
+        # Placeholders are bound to NULL; the plan does not depend on values.
+        self._explaining = True
+        try:
+            cursor = sqlite3.Cursor(self)
+            count = sql.count('?')
+            return cursor.execute(f'EXPLAIN QUERY PLAN {sql}', (None,) * count).fetchall()
+        finally:
+            self._explaining = False
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+    def commit(self):
+        if not self.in_transaction:
+            return super().commit()
+        record = PROFILER.begin_query(self, 'COMMIT')
+        self._current = record
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            PROFILER.add_time(record, time.perf_counter() - start)
+            self._current = None
+
+
+def set_enabled(enabled):
+    # The pool swaps its connections over as they come back to it.
+    global ENABLED
+    ENABLED = enabled
+
+
+def start_run(screen):
+    if ENABLED:
+        PROFILER.start_run(screen)
+
+
+def end_run():
+    if ENABLED:
+        PROFILER.end_run()
+
+
+def section(name):
+    return PROFILER.section(name)
+
+
+def fragment(name):
+    return PROFILER.fragment(name) if ENABLED else PROFILER.section(name)
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import os
+from dataclasses import dataclass, field
+
+import archive
+import db
+
+BATCH_ROWS = 5000
+MAX_ERRORS = 100
+# CSV header -> users column. Only ucnetid, firstname and lastname are required.
+COLUMNS = {
+    'ucnetid': 'ucnetid',
+    'firstname': 'firstname',
+    'lastname': 'lastname',
+    'gender': 'gender',
+    'first_generation_student': 'first_generation_student',
+    'transfer_student': 'transfer_student',
+    'major': 'major',
+    'year': 'year',
+    'other_major': 'other_major',
+    'student_id': 'student_id',
+}
+REQUIRED = ('ucnetid', 'firstname', 'lastname')
+YEARS = ("Freshman", "Sophomore", "Junior", "Senior", "Graduate")
+# Stored the way the new-user form stores them.
+YES_NO = {'yes': 'Yes', 'y': 'Yes', '1': 'Yes', 'true': 'Yes', 'no': 'No', 'n': 'No', '0': 'No', 'false': 'No'}
+FIELDS = list(COLUMNS.values())
+UPDATABLE = [c for c in FIELDS if c != 'ucnetid']
+
+
+@dataclass
+class SyncResult:
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    enabled: list = field(default_factory=list)
+    disabled: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    skipped: int = 0
+
+
+def clean_row(row):
+    # Returns (values in FIELDS order, None) or (None, error message).
+    values = {column: (row.get(header) or '').strip() for header, column in COLUMNS.items()}
+    values['ucnetid'] = values['ucnetid'].lower()
+    missing = [column for column in REQUIRED if not values[column]]
+    if missing:
+        return None, f"missing {', '.join(missing)}"
+    if any(c.isspace() for c in values['ucnetid']):
+        return None, f"ucnetid {values['ucnetid']!r} has spaces"
+    for column in ('first_generation_student', 'transfer_student'):
+        if values[column]:
+            if values[column].lower() not in YES_NO:
+                return None, f"{column} must be yes or no, not {values[column]!r}"
+            values[column] = YES_NO[values[column].lower()]
+    if values['year'] and values['year'].title() not in YEARS:
+        return None, f"year must be one of {', '.join(YEARS)}, not {values['year']!r}"
+    values['year'] = values['year'].title()
+    return [values[column] or None for column in FIELDS], None
+
+
+def _upsert(conn, batch, result):
+    # Stages the batch in temp.roster, then upserts it with one statement.
+    # New students come in enabled; existing ones keep enabled_user unless
+    # this is a sync. Blank cells keep what is already stored, and rows that
+    # wouldn't change aren't rewritten, so they don't fire the users triggers.
+    start = conn.execute('SELECT COALESCE(MAX(rowid), 0) FROM temp.roster').fetchone()[0]
+    conn.executemany(f'''INSERT INTO temp.roster ({', '.join(FIELDS)})
+                         VALUES ({', '.join('?' * len(FIELDS))})''', batch)
+    existing = conn.execute('''SELECT COUNT(*) FROM temp.roster r JOIN main.users u USING (ucnetid)
+                               WHERE r.rowid > ?''', (start,)).fetchone()[0]
+    updates = ', '.join(f'{c} = COALESCE(excluded.{c}, {c})' for c in UPDATABLE)
+    changed = ' OR '.join(f'excluded.{c} IS NOT NULL AND excluded.{c} IS NOT users.{c}' for c in UPDATABLE)
+    written = len(conn.execute(f'''INSERT INTO main.users ({', '.join(FIELDS)}, enabled_user)
+                                   SELECT {', '.join(FIELDS)}, 1 FROM temp.roster WHERE rowid > ? ORDER BY rowid
+                                   ON CONFLICT (ucnetid) DO UPDATE SET {updates}
+                                   WHERE {changed}
+                                   RETURNING ucnetid''', (start,)).fetchall())
+    result.inserted += len(batch) - existing
+    result.updated += written - (len(batch) - existing)
+    result.unchanged += len(batch) - written
+
+
+def sync(conn, lines, sync_users=False, progress=None, batch_rows=BATCH_ROWS):
+    # Upserts every valid row of a roster CSV in one transaction. With
+    # sync_users, roster students are re-enabled and enabled users missing
+    # from it are disabled. progress(rows) is called after each batch.
+    result = SyncResult()
+    seen = set()
+    conn.execute('DROP TABLE IF EXISTS temp.roster')
+    conn.execute(f"CREATE TEMP TABLE roster ({', '.join(FIELDS)})")
+    conn.execute('CREATE UNIQUE INDEX temp.roster_ucnetid ON roster (ucnetid)')
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        batch = []
+        reader = csv.DictReader(lines)
+        unknown = set(reader.fieldnames or ()) - set(COLUMNS)
+        if 'ucnetid' not in (reader.fieldnames or ()):
+            raise ValueError(f"roster has no ucnetid column (columns: {', '.join(reader.fieldnames or ())})")
+        for row in reader:
+            result.rows += 1
+            values, error = clean_row(row)
+            if values and values[0] in seen:
+                values, error = None, f'duplicate ucnetid {values[0]}'
+            if error:
+                result.skipped += 1
+                if len(result.errors) < MAX_ERRORS:
+                    result.errors.append((reader.line_num, error))
+                continue
+            seen.add(values[0])
+            batch.append(values)
+            if len(batch) >= batch_rows:
+                _upsert(conn, batch, result)
+                batch = []
+                if progress:
+                    progress(result.rows)
+        if batch:
+            _upsert(conn, batch, result)
+        if sync_users:
+            result.enabled = [row[0] for row in conn.execute('''UPDATE users SET enabled_user = 1
+                                                               WHERE enabled_user IS NOT 1
+                                                                 AND ucnetid IN (SELECT ucnetid FROM temp.roster)
+                                                               RETURNING ucnetid''')]
+            result.disabled = [row[0] for row in conn.execute('''UPDATE users SET enabled_user = 0
+                                                                WHERE enabled_user = 1
+                                                                  AND ucnetid NOT IN (SELECT ucnetid FROM temp.roster)
+                                                                RETURNING ucnetid''')]
+        # Inserts alone don't bump users_version; kiosks reload their user index on it.
+        if result.inserted:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'users_version'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DROP TABLE IF EXISTS temp.roster')
+    if progress:
+        progress(result.rows)
+    if unknown:
+        result.errors.insert(0, (1, f"ignored columns: {', '.join(sorted(unknown))}"))
+    # Archived visits of users whose enabled_user flipped move rollup buckets too.
+    if result.enabled:
+        archive.user_enabled_changed(conn, result.enabled, 1)
+    if result.disabled:
+        archive.user_enabled_changed(conn, result.disabled, 0)
+    return result
+
+
+def sync_file(path, sync_users=False, progress=None):
+    with open(path, encoding='utf-8-sig', newline='') as lines, db.connection('roster') as conn:
+        return sync(conn, lines, sync_users, progress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a registrar roster CSV into users.')
+    parser.add_argument('csv', help=f"roster with a header row; columns: {', '.join(COLUMNS)}")
+    parser.add_argument('--sync', action='store_true',
+                        help='also enable everyone in the roster and disable enabled users who are not')
+    args = parser.parse_args()
+    size = os.path.getsize(args.csv)
+    print(f'{args.csv}: {size / 2**20:.1f} MiB')
+    result = sync_file(args.csv, args.sync, lambda rows: print(f'  {rows} rows', end='\r', flush=True))
+    print(f'{result.rows} rows: {result.inserted} inserted, {result.updated} updated, {result.unchanged} unchanged, '
+          f'{len(result.enabled)} enabled, {len(result.disabled)} disabled, {result.skipped} skipped')
+    for line, error in result.errors:
+        print(f'  line {line}: {error}')
+
+
+if __name__ == '__main__':
+    main()
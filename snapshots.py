@@ -0,0 +1,234 @@
+import argparse
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+import archive
+import stats
+
+SNAPSHOT_DIR = 'report_snapshots'
+DAY = 86400
+# Snapshot rows kept decoded in memory per process.
+MAX_ROWS = 2_000_000
+SCHEMA = pa.schema([('ts', pa.int64()), ('timestamp', pa.string()), ('ucnetid', pa.string()), ('purpose', pa.int64())])
+
+
+def _snapshot_sql(visits):
+    # The report's visit columns only: names and enabled_user can still
+    # change, so they are joined in when the snapshot is read.
+    return f'''SELECT visits.ts, visits.ucnetid, {stats.PURPOSE_MASK} AS purpose
+               FROM {visits} AS visits
+               WHERE visits.ts >= ? AND visits.ts < ?
+               ORDER BY visits.ts'''
+
+
+def _day(ts):
+    # The UTC date of an epoch timestamp, like the report's day boundaries.
+    return date(1970, 1, 1) + timedelta(days=int(ts) // DAY)
+
+
+def closed_periods(start, end, now=None):
+    # (period, start_ts, end_ts) of closed periods overlapping [start, end):
+    # whole months before the current one, then each finished day of it.
+    today = _day(now if now is not None else time.time())
+    month_start = today.replace(day=1)
+    periods = []
+    if start < archive.to_epoch(month_start):
+        month = _day(start).replace(day=1)
+        while month < month_start and archive.to_epoch(month) < end:
+            following = (month + timedelta(days=32)).replace(day=1)
+            periods.append((month.strftime('%Y-%m'), archive.to_epoch(month), archive.to_epoch(following)))
+            month = following
+    day = max(month_start, _day(start))
+    while day < today and archive.to_epoch(day) < end:
+        periods.append((day.isoformat(), archive.to_epoch(day), archive.to_epoch(day) + DAY))
+        day += timedelta(days=1)
+    return periods
+
+
+def _directory(conn):
+    return archive._main_file(conn).parent
+
+
+def build(conn, period, start, end):
+    # Writes the period's snapshot and records it in the manifest, unless a
+    # visit in it changed while it was being read. Returns (token, frame).
+    token = uuid.uuid4().hex
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute('''INSERT OR REPLACE INTO report_snapshots (start_ts, end_ts, period, token)
+                    VALUES (?, ?, ?, ?)''', (start, end, period, token))
+    conn.commit()
+    frames = [pd.read_sql_query(_snapshot_sql(visits), conn, params=(start, end))
+              for visits in stats.visit_sources(conn, start, end)]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df.insert(1, 'timestamp', stats.format_timestamps(pd.to_datetime(df['ts'], unit='s')))
+    df = df.astype({'ts': 'int64', 'purpose': 'int64'})
+
+    relative = Path(SNAPSHOT_DIR) / f'report_{period}.parquet'
+    path = _directory(conn) / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Readers may have the old file open; replace it in one step.
+    partial = path.with_suffix(f'.{token}.tmp')
+    pq.write_table(pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False), partial)
+    os.replace(partial, path)
+    conn.execute('BEGIN IMMEDIATE')
+    recorded = conn.execute('UPDATE report_snapshots SET path = ?, visits = ? WHERE start_ts = ? AND end_ts = ? AND token = ?',
+                            (relative.as_posix(), len(df), start, end, token)).rowcount
+    # A closed month replaces the day snapshots taken while it was open.
+    superseded = conn.execute('''DELETE FROM report_snapshots
+                                 WHERE start_ts >= ? AND end_ts <= ? AND end_ts - start_ts < ?
+                                 RETURNING path''', (start, end, end - start)).fetchall() if recorded else []
+    conn.commit()
+    for (old,) in superseded:
+        if old:
+            (_directory(conn) / old).unlink(missing_ok=True)
+    return token, df
+
+
+class SnapshotCache:
+    # Snapshot frames already read by this process, keyed by period and
+    # build token (a rebuilt snapshot gets a new one), plus enabled
+    # users' names for joining them. Oldest frames go past MAX_ROWS.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._rows = 0
+        self._users_key = None
+        self.index = pd.Index([], dtype=object)
+        self.firstname = np.empty(0, object)
+        self.lastname = np.empty(0, object)
+
+    def get(self, period, token):
+        with self._lock:
+            cached = self._frames.get(period)
+            if cached is None or cached[0] != token:
+                return None
+            self._frames.move_to_end(period)
+            return cached[1]
+
+    def put(self, period, token, df):
+        with self._lock:
+            old = self._frames.pop(period, None)
+            self._rows -= len(old[1]) if old else 0
+            self._frames[period] = (token, df)
+            self._rows += len(df)
+            while self._rows > MAX_ROWS and len(self._frames) > 1:
+                self._rows -= len(self._frames.popitem(last=False)[1][1])
+
+    def refresh_users(self, conn):
+        with self._lock:
+            # New users don't bump users_version, so the highest rowid is part of the key.
+            key = conn.execute('''SELECT (SELECT value FROM meta WHERE key = 'users_version'),
+                                         (SELECT MAX(rowid) FROM users)''').fetchone()
+            if key == self._users_key:
+                return
+            rows = conn.execute('SELECT ucnetid, firstname, lastname FROM users WHERE enabled_user = 1').fetchall()
+            ucnetids, firstnames, lastnames = zip(*rows) if rows else ((), (), ())
+            self.index = pd.Index(ucnetids, dtype=object)
+            self.firstname = np.array(firstnames, object)
+            self.lastname = np.array(lastnames, object)
+            self._users_key = key
+
+    def join_users(self, df):
+        # Same rows as the report's JOIN users ... WHERE enabled_user = 1.
+        users = self.index.get_indexer(df['ucnetid'])
+        df = df[users >= 0].reset_index(drop=True)
+        users = users[users >= 0]
+        df['firstname'] = self.firstname[users]
+        df['lastname'] = self.lastname[users]
+        return df
+
+
+@st.cache_resource(show_spinner=False)
+def get_cache():
+    return SnapshotCache()
+
+
+def load(conn, start, end, cache, now=None):
+    # Snapshot rows for every closed period overlapping [start, end), built
+    # on first use. Returns the frames and where the closed periods stop.
+    periods = closed_periods(start, end, now)
+    manifest = {row[:2]: row[2:] for row in conn.execute('''SELECT start_ts, end_ts, path, token FROM report_snapshots
+                                                           WHERE path IS NOT NULL AND end_ts > ? AND start_ts < ?''',
+                                                        (start, end))}
+    directory = _directory(conn)
+    frames = []
+    for period, period_start, period_end in periods:
+        path, token = manifest.get((period_start, period_end), (None, None))
+        df = cache.get(period, token) if token else None
+        if df is None and path:
+            try:
+                df = pq.read_table(directory / path).to_pandas()
+                cache.put(period, token, df)
+            except FileNotFoundError:
+                pass
+        if df is None:
+            token, df = build(conn, period, period_start, period_end)
+            cache.put(period, token, df)
+        if period_start < start or period_end > end:
+            df = df[(df['ts'] >= start) & (df['ts'] < end)]
+        frames.append(df)
+    return frames, periods[-1][2] if periods else start
+
+
+def date_range_report(conn, start_date, end_date, cache=None):
+    # stats.date_range_report stitched from snapshots of the closed periods
+    # plus a live query for the still-open tail.
+    cache = cache or get_cache()
+    start, end = stats._date_range_params(start_date, end_date)
+    frames, closed_end = load(conn, start, end, cache)
+    if frames:
+        cache.refresh_users(conn)
+        frames = [cache.join_users(pd.concat(frames, ignore_index=True))]
+    if closed_end < end:
+        live = stats.date_range_rows(conn, max(start, closed_end), end)
+        live.insert(1, 'timestamp', stats.format_timestamps(pd.to_datetime(live['ts'], unit='s')))
+        frames.append(live)
+    return stats.format_report(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+
+
+def build_closed(conn, rebuild=False):
+    # Materializes every closed period from the first visit on.
+    first = [row[0] for row in conn.execute('SELECT MIN(ts) FROM visits')]
+    first += [archive.to_epoch(date.fromisoformat(month + '-01')) for month, _ in archive.partitions(conn)[:1]]
+    first = [ts for ts in first if ts is not None]
+    if not first:
+        return {}
+    built = {}
+    existing = set(conn.execute('SELECT start_ts, end_ts FROM report_snapshots WHERE path IS NOT NULL'))
+    for period, start, end in closed_periods(min(first), int(time.time())):
+        if rebuild or (start, end) not in existing:
+            built[period] = len(build(conn, period, start, end)[1])
+    return built
+
+
+def main():
+    import db
+
+    parser = argparse.ArgumentParser(description='Build Date Range report snapshots for closed months and days.')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild snapshots that already exist')
+    parser.add_argument('--list', action='store_true', help='show the snapshot manifest and exit')
+    args = parser.parse_args()
+
+    with db.connection('snapshots') as conn:
+        if args.list:
+            for row in conn.execute('SELECT period, path, visits, built_at FROM report_snapshots ORDER BY start_ts'):
+                print(*row, sep='\t')
+            return
+        for period, visits in build_closed(conn, args.rebuild).items():
+            print(f'{period}: {visits} visits')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import archive
+import migrations
+
+SERVICE_LABELS = {
+    'advice': 'Advice',
+    'tutor': 'Tutoring',
+    'wellness_corner': 'Wellness Corner',
+    'hangout': 'Hangout',
+    'study_center': 'Study center',
+}
+
+SUPPLY_LABELS = {
+    'printing_3d': '3D',
+    'printing_paper': 'Printing',
+    'coffee': 'Coffee',
+    'snacks': 'Snacks',
+    'testing_supplies': 'Testing supplies',
+    'other': 'Other',
+}
+
+# SQLite expressions that truncate an hourly rollup bucket to the chart grain.
+GRAINS = {
+    'Hour': ('hour', '-2 days'),
+    'Day': ('substr(hour, 1, 10)', '-90 days'),
+    'Week': ("date(hour, '-6 days', 'weekday 1')", None),
+}
+
+
+# Flags shown in the Date Range "Purpose" column, in display order.
+PURPOSE_FLAGS = [
+    ('advice', 'Advice'),
+    ('tutor', 'Tutoring'),
+    ('wellness_corner', 'Wellness Corner'),
+    ('hangout', 'Hangout'),
+    ('study_center', 'Study Center'),
+    ('printing_3d', '3D Printing'),
+    ('printing_paper', 'Printing Paper'),
+    ('coffee', 'Coffee'),
+    ('testing_supplies', 'Testing Supplies'),
+    ('other', 'Other Supplies'),
+]
+# A visit's services and supplies bitmasks side by side in one integer.
+PURPOSE_MASK = f'(visits.services | (visits.supplies << {len(migrations.SERVICE_BITS)}))'
+PURPOSE_BITS = [migrations.SERVICE_BITS.index(c) if c in migrations.SERVICE_BITS
+                else len(migrations.SERVICE_BITS) + migrations.SUPPLY_BITS.index(c)
+                for c, _ in PURPOSE_FLAGS]
+# Every possible flag combination pre-rendered, indexed by PURPOSE_MASK.
+PURPOSE_TEXT = np.array([
+    ', '.join(label for bit, (_, label) in zip(PURPOSE_BITS, PURPOSE_FLAGS) if mask >> bit & 1)
+    or 'No services or supplies selected'
+    for mask in range(1 << len(migrations.SERVICE_BITS) + len(migrations.SUPPLY_BITS))
+], dtype=object)
+
+# Seeded/imported rows store the yes/no answers as '1'/'0'; the form stores 'Yes'/'No'.
+YES_NO = {'1': 'Yes', '0': 'No', 1: 'Yes', 0: 'No'}
+
+
+@dataclass
+class Demographics:
+    total: int
+    major: pd.Series
+    year: pd.Series
+    gender: pd.Series
+    first_gen: pd.Series
+    transfer: pd.Series
+    major_by_year: pd.DataFrame
+    first_gen_by_transfer: pd.DataFrame
+
+
+def demographics(conn):
+    # One GROUP BY pass over enabled users; every breakdown below is derived
+    # from these (at most a few hundred) combination counts.
+    combos = pd.read_sql_query('''SELECT major, year, gender,
+                                         first_generation_student AS first_gen,
+                                         transfer_student AS transfer,
+                                         COUNT(*) AS students
+                                  FROM users
+                                  WHERE enabled_user = 1
+                                  GROUP BY 1, 2, 3, 4, 5''', conn)
+    for column in ('first_gen', 'transfer'):
+        combos[column] = combos[column].replace(YES_NO)
+
+    def breakdown(column):
+        return combos.groupby(column)['students'].sum().sort_values(ascending=False)
+
+    def crosstab(rows, columns):
+        return combos.pivot_table(index=rows, columns=columns, values='students', aggfunc='sum', fill_value=0)
+
+    return Demographics(
+        total=int(combos['students'].sum()),
+        major=breakdown('major'),
+        year=breakdown('year'),
+        gender=breakdown('gender'),
+        first_gen=breakdown('first_gen'),
+        transfer=breakdown('transfer'),
+        major_by_year=crosstab('major', 'year'),
+        first_gen_by_transfer=crosstab('first_gen', 'transfer'),
+    )
+
+
+def visits_over_time(conn, grain='Day'):
+    bucket, since = GRAINS[grain]
+    where = "WHERE enabled = 1 AND hour >= datetime('now', ?)" if since else 'WHERE enabled = 1'
+    params = (since,) if since else ()
+    rows = conn.execute(f'''SELECT {bucket} AS bucket, SUM(visits)
+                            FROM visit_rollup
+                            {where}
+                            GROUP BY bucket
+                            ORDER BY bucket''', params).fetchall()
+    return pd.DataFrame(rows, columns=[grain, 'Visits']).set_index(grain)
+
+
+REPORT_COLUMNS = ['ts', 'ucnetid', 'firstname', 'lastname', 'purpose']
+
+
+def _date_range_sql(visits):
+    return f'''SELECT visits.ts,
+                     visits.ucnetid,
+                     users.firstname,
+                     users.lastname,
+                     {PURPOSE_MASK} AS purpose
+              FROM {visits} AS visits
+              JOIN users ON visits.ucnetid = users.ucnetid
+              WHERE users.enabled_user = 1
+                AND visits.ts >= ? AND visits.ts < ?
+              ORDER BY visits.ts'''
+
+
+def _date_range_params(start_date, end_date):
+    # The end date covers the whole day: everything before midnight (UTC) of the next one.
+    return (archive.to_epoch(start_date), archive.to_epoch(end_date + timedelta(days=1)))
+
+
+def visit_sources(conn, start=None, end=None):
+    # Archived months overlapping [start, end) oldest first, then the live
+    # table. Each partition is only attached while the caller reads from it.
+    for partition in archive.partitions(conn, start, end):
+        with archive.attached(conn, partition) as visits:
+            yield visits
+    yield 'main.visits'
+
+
+def format_timestamps(timestamps):
+    return timestamps.dt.strftime('%m/%d/%y %I:%M %p')
+
+
+def format_report(df, text_timestamps=True):
+    # Report snapshots carry the timestamp text already formatted.
+    if text_timestamps and 'timestamp' in df:
+        timestamps = df['timestamp']
+    else:
+        timestamps = pd.to_datetime(df['ts'], unit='s')
+        if text_timestamps:
+            timestamps = format_timestamps(timestamps)
+    return pd.DataFrame({
+        'Timestamp': timestamps,
+        'Email': df['ucnetid'],
+        'First Name': df['firstname'],
+        'Last Name': df['lastname'],
+        'Purpose': PURPOSE_TEXT[df['purpose'].to_numpy(dtype=np.int64)],
+    })
+
+
+def date_range_rows(conn, start, end):
+    # Unformatted report rows for [start, end) epoch seconds.
+    frames = [pd.read_sql_query(_date_range_sql(visits), conn, params=(start, end))
+              for visits in visit_sources(conn, start, end)]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def date_range_report(conn, start_date, end_date):
+    return format_report(date_range_rows(conn, *_date_range_params(start_date, end_date)))
+
+
+def date_range_chunks(conn, start_date, end_date, chunk_rows=50_000, text_timestamps=True):
+    # Same rows as date_range_report, fetched and formatted chunk_rows at a time.
+    params = _date_range_params(start_date, end_date)
+    for visits in visit_sources(conn, *params):
+        cursor = conn.execute(_date_range_sql(visits), params)
+        try:
+            while rows := cursor.fetchmany(chunk_rows):
+                yield format_report(pd.DataFrame(rows, columns=REPORT_COLUMNS), text_timestamps)
+        finally:
+            cursor.close()
+
+
+def date_range_count(conn, start_date, end_date):
+    # Visits in the range, disabled users' included, counted off the ts index.
+    params = _date_range_params(start_date, end_date)
+    return sum(conn.execute(f'SELECT COUNT(*) FROM {visits} WHERE ts >= ? AND ts < ?', params).fetchone()[0]
+               for visits in visit_sources(conn, *params))
+
+
+# Dashboard visitor windows, shortest first.
+WINDOWS = {
+    'Past hour': timedelta(hours=1),
+    'Past 5 hours': timedelta(hours=5),
+    'Past week': timedelta(days=7),
+    'Past month': timedelta(days=30),
+}
@@ -0,0 +1,13 @@
+# Multiselect label -> supplies column, in visits.supplies bit order.
+SUPPLY_FLAGS = [
+    ('Printer', 'printing_paper'),
+    ('3D printer', 'printing_3d'),
+    ('Test materials', 'testing_supplies'),
+    ('Coffee', 'coffee'),
+    ('Snacks', 'snacks'),
+    ('Other', 'other'),
+]
+
+
+def supply_mask(supplies):
+    return sum(1 << bit for bit, (label, _) in enumerate(SUPPLY_FLAGS) if label in supplies)
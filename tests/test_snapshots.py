@@ -0,0 +1,74 @@
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import archive  # noqa: E402
+import migrations  # noqa: E402
+import snapshots  # noqa: E402
+
+SEPTEMBER = (archive.to_epoch(date(2025, 9, 1)), archive.to_epoch(date(2025, 10, 1)))
+# While September is open, and once it has closed.
+OPEN = archive.to_epoch(date(2025, 9, 20))
+CLOSED = archive.to_epoch(date(2025, 10, 5))
+
+
+def at(day, hour=12):
+    return archive.to_epoch(day) + hour * 3600
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(tmp_path / 'sign_in.db')
+    migrations.migrate(conn)
+    conn.execute("INSERT INTO users (ucnetid, firstname, lastname, enabled_user) VALUES ('anteater', 'Peter', 'Anteater', 1)")
+    for day in (3, 10, 15):
+        visit(conn, date(2025, 9, day))
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def visit(conn, day):
+    conn.execute("INSERT INTO visits (ucnetid, ts, services) VALUES ('anteater', ?, 1)", (at(day),))
+
+
+def september(conn, now):
+    frames, _ = snapshots.load(conn, *SEPTEMBER, snapshots.SnapshotCache(), now)
+    return sum(len(df) for df in frames)
+
+
+def periods(conn):
+    return [row[0] for row in conn.execute('SELECT period FROM report_snapshots ORDER BY start_ts, end_ts')]
+
+
+def test_closed_month_is_not_read_from_its_first_day(conn, tmp_path):
+    assert september(conn, OPEN) == 3
+    assert '2025-09-01' in periods(conn)
+
+    assert september(conn, CLOSED) == 3
+    # The month's snapshot replaces the days taken while it was open.
+    assert periods(conn) == ['2025-09']
+    assert [p.name for p in (tmp_path / snapshots.SNAPSHOT_DIR).iterdir()] == ['report_2025-09.parquet']
+
+
+def test_late_write_drops_every_snapshot_covering_it(conn):
+    september(conn, OPEN)
+    # A month snapshot still sitting next to its day snapshots.
+    conn.execute("""INSERT INTO report_snapshots (start_ts, end_ts, period, path, visits, token)
+                    VALUES (?, ?, '2025-09', 'report_2025-09.parquet', 3, 'month')""", SEPTEMBER)
+    conn.commit()
+
+    visit(conn, date(2025, 9, 15))
+    conn.commit()
+    left = periods(conn)
+    assert '2025-09' not in left
+    assert '2025-09-15' not in left
+    assert '2025-09-10' in left
+
+    assert september(conn, CLOSED) == 4
@@ -0,0 +1,106 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import db  # noqa: E402
+import writer  # noqa: E402
+
+
+class StalledWriter(writer.CheckinWriter):
+    # Acknowledges check-ins but never gets as far as committing them.
+    def _run(self):
+        pass
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'sign_in.db'))
+    db.get_pool.clear()
+    yield str(tmp_path / 'sign_in.db.journal')
+    db.get_pool.clear()
+
+
+def checkin(w, ucnetid):
+    return w.submit('checkin', (ucnetid, 1, 0, 1760000000))
+
+
+def visits(ucnetid):
+    with db.connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM visits WHERE ucnetid = ?', (ucnetid,)).fetchone()[0]
+
+
+def crash(w):
+    # Closing the journal drops its lock, as the process exiting would.
+    w._journal.close()
+
+
+def test_crash_before_commit_is_replayed_once(base):
+    stalled = StalledWriter(base)
+    checkin(stalled, 'crashed')
+    crash(stalled)
+    assert visits('crashed') == 0
+
+    w = writer.CheckinWriter(base, interval=0)
+    assert visits('crashed') == 1
+    assert not Path(stalled.journal_path).exists()
+    w.close()
+
+    # Nothing is left for the next start to replay again.
+    writer.CheckinWriter(base, interval=0).close()
+    assert visits('crashed') == 1
+
+
+def test_replay_after_commit_does_not_duplicate(base):
+    # Committed, but the process died before emptying its journal.
+    with open(f'{base}.dead', 'w') as journal:
+        journal.write(json.dumps({'id': 'op1', 'kind': 'checkin', 'params': ['late', 1, 0, 1760000000]}) + '\n')
+    with db.connection() as conn:
+        conn.execute("INSERT INTO visits (ucnetid, services, supplies, ts) VALUES ('late', 1, 0, 1760000000)")
+        conn.execute("INSERT INTO applied_writes (op_id, journal) VALUES ('op1', 'dead')")
+
+    writer.CheckinWriter(base, interval=0).close()
+    assert visits('late') == 1
+    with db.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM applied_writes').fetchone()[0] == 0
+
+
+def test_two_writers_keep_their_own_journals(base):
+    stalled = StalledWriter(base)
+    checkin(stalled, 'stalled')
+    w = writer.CheckinWriter(base, interval=0)
+    assert w.wait(checkin(w, 'live'), timeout=5)
+    # Emptying its own journal leaves the other writer's acknowledged line alone.
+    assert Path(stalled.journal_path).read_text().count('\n') == 1
+
+    # A writer starting while the other is alive does not replay its journal.
+    writer.CheckinWriter(base, interval=0).close()
+    assert visits('stalled') == 0
+
+    crash(stalled)
+    writer.CheckinWriter(base, interval=0).close()
+    w.close()
+    assert visits('stalled') == 1
+    assert visits('live') == 1
+
+
+def test_writer_stops_acknowledging_when_its_thread_dies(base):
+    w = writer.CheckinWriter(base, interval=0)
+    ticket = w.submit('unknown', ())
+    assert not w.wait(ticket, timeout=5)
+    assert not w.running
+    with pytest.raises(RuntimeError):
+        checkin(w, 'refused')
+    crash(w)
+
+
+def test_legacy_shared_journal_is_replayed(base):
+    with open(base, 'w') as journal:
+        journal.write(json.dumps({'id': 'op2', 'kind': 'checkin', 'params': ['legacy', 1, 0, 1760000000]}) + '\n')
+    writer.CheckinWriter(base, interval=0).close()
+    assert visits('legacy') == 1
+    assert not Path(base).exists()
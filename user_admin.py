@@ -0,0 +1,69 @@
+import json
+import re
+
+import pandas as pd
+
+import archive
+import db
+import user_index
+
+PAGE_SIZE = 50
+STATUS_FILTERS = {
+    'Enabled': 'users.enabled_user = 1',
+    'Disabled': 'users.enabled_user IS NOT 1',
+    'All': '1',
+}
+PAGE_COLUMNS = '''users.ucnetid AS "UCNetID", users.firstname AS "First Name", users.lastname AS "Last Name",
+                  users.enabled_user = 1 AS "Enabled"'''
+
+
+def match_query(text):
+    # Every word has to prefix-match ucnetid, first or last name.
+    return ' '.join(f'"{word}"*' for word in re.findall(r'[^\W_]+', text))
+
+
+def search(conn, text='', status='Enabled', page=1, page_size=PAGE_SIZE):
+    # One page of users plus the total number of matches.
+    where = STATUS_FILTERS[status]
+    match = match_query(text)
+    if match:
+        source = 'users_fts JOIN users ON users.rowid = users_fts.rowid'
+        where = f'users_fts MATCH ? AND {where}'
+        params = (match,)
+    else:
+        source = 'users'
+        params = ()
+    total = conn.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params).fetchone()[0]
+    df = pd.read_sql_query(f'''SELECT {PAGE_COLUMNS}
+                               FROM {source}
+                               WHERE {where}
+                               ORDER BY users.lastname, users.firstname, users.ucnetid
+                               LIMIT ? OFFSET ?''', conn, params=params + (page_size, (page - 1) * page_size))
+    df['Enabled'] = df['Enabled'].astype(bool)
+    return df, total
+
+
+def set_enabled(ucnetids, enabled):
+    # Flips every listed user that isn't already in that state in a single
+    # transaction and returns the ones that changed.
+    selected = json.dumps(list(ucnetids))
+    with db.connection('set_enabled') as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        changed = [row[0] for row in conn.execute('''SELECT ucnetid FROM users
+                                                     WHERE ucnetid IN (SELECT value FROM json_each(?))
+                                                       AND (enabled_user = 1) IS NOT ?''', (selected, bool(enabled)))]
+        conn.execute('UPDATE users SET enabled_user = ? WHERE ucnetid IN (SELECT value FROM json_each(?))',
+                     (int(enabled), json.dumps(changed)))
+        conn.commit()
+        if not changed:
+            return changed
+        archive.user_enabled_changed(conn, changed, enabled)
+        index = user_index.get_index()
+        if enabled:
+            for row in conn.execute(f'''SELECT {user_index.USER_COLUMNS} FROM users
+                                        WHERE ucnetid IN (SELECT value FROM json_each(?))''', (json.dumps(changed),)):
+                index.add(row)
+        else:
+            for ucnetid in changed:
+                index.remove(ucnetid)
+    return changed
@@ -0,0 +1,101 @@
+import bisect
+import threading
+import time
+
+import streamlit as st
+
+import db
+
+USER_COLUMNS = ('ucnetid, firstname, lastname, gender, first_generation_student, transfer_student, major, year, '
+                'enabled_user, other_major, student_id')
+CHECK_INTERVAL = 5
+MIN_PREFIX = 3
+
+
+def student_key(student_id):
+    # The new-user form stores a row of dots as the student id; blank and
+    # placeholder ids must never match anyone.
+    student_id = (student_id or '').strip()
+    return student_id if any(c.isalnum() for c in student_id) else None
+
+
+class UserIndex:
+    # Enabled users by ucnetid and student id, plus a sorted list of
+    # lowercased ucnetids for prefix suggestions. Misses are not trusted:
+    # check_user falls back to the database, which also picks up users
+    # added by another kiosk process.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0
+        self._by_ucnetid = {}
+        self._by_student_id = {}
+        self._sorted = []
+
+    def _current_version(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'users_version'").fetchone()
+        return row[0] if row else 0
+
+    def refresh(self, force=False):
+        with self._lock:
+            if not force and time.monotonic() - self._checked < CHECK_INTERVAL:
+                return
+            with db.connection('user_index') as conn:
+                version = self._current_version(conn)
+                if version != self._version:
+                    rows = conn.execute(f'SELECT {USER_COLUMNS} FROM users WHERE enabled_user = 1').fetchall()
+            self._checked = time.monotonic()
+            if version == self._version:
+                return
+            self._by_ucnetid = {row[0]: row for row in rows}
+            self._by_student_id = {key: row for row in rows if (key := student_key(row[-1]))}
+            self._sorted = sorted((row[0].lower(), row[0]) for row in rows)
+            self._version = version
+
+    def lookup(self, ucnetid, student_id):
+        self.refresh()
+        user = self._by_ucnetid.get(ucnetid)
+        if user is None and (key := student_key(student_id)):
+            user = self._by_student_id.get(key)
+        return user
+
+    def suggest(self, text, limit=5):
+        # Enabled ucnetids starting with text. A typo near the end would match
+        # nothing, so the prefix is shortened until something does.
+        self.refresh()
+        prefix = text.strip().lower()
+        with self._lock:
+            while len(prefix) >= MIN_PREFIX:
+                start = bisect.bisect_left(self._sorted, (prefix,))
+                matches = [ucnetid for key, ucnetid in self._sorted[start:start + limit] if key.startswith(prefix)]
+                if matches:
+                    return matches
+                prefix = prefix[:-1]
+        return []
+
+    def add(self, row):
+        with self._lock:
+            if row[0] not in self._by_ucnetid:
+                bisect.insort(self._sorted, (row[0].lower(), row[0]))
+            self._by_ucnetid[row[0]] = row
+            if key := student_key(row[-1]):
+                self._by_student_id[key] = row
+
+    def remove(self, ucnetid):
+        with self._lock:
+            row = self._by_ucnetid.pop(ucnetid, None)
+            if row is None:
+                return
+            if (key := student_key(row[-1])) and self._by_student_id.get(key) is row:
+                del self._by_student_id[key]
+            index = bisect.bisect_left(self._sorted, (ucnetid.lower(), ucnetid))
+            if index < len(self._sorted) and self._sorted[index][1] == ucnetid:
+                del self._sorted[index]
+
+
+@st.cache_resource(show_spinner=False)
+def get_index():
+    index = UserIndex()
+    index.refresh(force=True)
+    return index
@@ -0,0 +1,239 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+import db
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+WRITE_BEHIND = os.environ.get('OAI_WRITE_BEHIND', '0') == '1'
+FLUSH_INTERVAL = float(os.environ.get('OAI_FLUSH_INTERVAL', '0.5'))
+# Each writer journals to JOURNAL_PATH.<pid>-<nonce>; a bare JOURNAL_PATH is
+# left over from before journals were per process and is replayed like one.
+JOURNAL_PATH = db.DB_PATH + '.journal'
+RETRY_DELAY = 1.0
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = {
+    'checkin': '''INSERT INTO visits (ucnetid, services, supplies, ts)
+                  VALUES (?, ?, ?, ?)''',
+    # Check-ins journaled before the visits table; the transaction_log view converts them.
+    'visit': '''INSERT INTO transaction_log (ucnetid, supply_id, advice, tutor, wellness_corner, hangout, study_center, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+    'user': '''INSERT OR IGNORE INTO users (ucnetid, firstname, lastname, gender, first_generation_student, transfer_student, major, year, enabled_user, other_major, student_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+}
+
+
+def _lock(file, block=True):
+    # An exclusive lock held until the file is closed, so it goes away with
+    # the process that took it. False if someone else holds it and not block.
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | (0 if block else fcntl.LOCK_NB))
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_LOCK if block else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        if block:
+            raise
+        return False
+    return True
+
+
+class CheckinWriter:
+    # Check-ins are appended to this writer's own on-disk journal and
+    # acknowledged once it is fsynced; a single thread commits whatever has
+    # accumulated once per flush interval. A journal stays locked while its
+    # writer is alive, so one nobody holds was left by a crashed process: the
+    # next writer to start replays it, with applied_writes making the replay
+    # idempotent.
+
+    def __init__(self, journal_base=JOURNAL_PATH, interval=FLUSH_INTERVAL):
+        self.journal_base = journal_base
+        self.key = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.journal_path = f'{journal_base}.{self.key}'
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._pending = []
+        self._submitted = 0
+        self._committed = 0
+        self._clear_applied = False
+        self._stopped = False
+        self._sync_lock = threading.Lock()
+        self._synced = 0
+        self._error = None
+        # Writers create their journals and look for abandoned ones under one
+        # lock, so no journal is found before its owner has locked it.
+        with open(f'{journal_base}.lock', 'a') as guard:
+            _lock(guard)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            _lock(self._journal)
+            self.replay()
+        self._thread = threading.Thread(target=self._run, name='checkin-writer', daemon=True)
+        self._thread.start()
+
+    def replay(self):
+        # Journals still locked belong to live writers and are left alone.
+        replayed = 0
+        for path in sorted(glob.glob(glob.escape(self.journal_base) + '*')):
+            if path in (self.journal_path, f'{self.journal_base}.lock'):
+                continue
+            with open(path, 'r+', encoding='utf-8') as journal:
+                if not _lock(journal, block=False):
+                    continue
+                replayed += self._replay(journal, path[len(self.journal_base) + 1:])
+            os.remove(path)
+        return replayed
+
+    def _replay(self, journal, key):
+        ops = []
+        for line in journal:
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write was never acknowledged.
+                logger.warning('Skipping unreadable journal line: %r', line)
+        if ops:
+            self._commit(ops, key)
+        # The journal goes first: applied_writes is all that keeps its lines
+        # from being inserted twice if we crash before it is empty.
+        journal.truncate(0)
+        os.fsync(journal.fileno())
+        with db.connection('journal_replay') as conn:
+            conn.execute('DELETE FROM applied_writes WHERE journal = ?', (key,))
+        logger.info('Replayed %d journaled check-ins from %s', len(ops), journal.name)
+        return len(ops)
+
+    @property
+    def running(self):
+        return self._error is None and self._thread.is_alive()
+
+    def submit(self, kind, params):
+        op = {'id': uuid.uuid4().hex, 'kind': kind, 'params': list(params)}
+        with self._cond:
+            if self._error is not None:
+                raise RuntimeError('The check-in writer has stopped') from self._error
+            self._journal.write(json.dumps(op) + '\n')
+            self._journal.flush()
+            self._pending.append(op)
+            self._submitted += 1
+            ticket = self._submitted
+            self._cond.notify_all()
+        self._sync(ticket)
+        return ticket
+
+    def _sync(self, ticket):
+        # One fsync covers every line written before it, so kiosks submitting
+        # at the same time share it instead of queueing for one each.
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._cond:
+                written = self._submitted
+            os.fsync(self._journal.fileno())
+            self._synced = written
+
+    def pending_user(self, ucnetid):
+        with self._cond:
+            return any(op['kind'] == 'user' and op['params'][0] == ucnetid for op in self._pending)
+
+    def wait(self, ticket, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._committed >= ticket or self._error is not None, timeout)
+            return self._committed >= ticket
+
+    def flush(self, timeout=None):
+        with self._cond:
+            ticket = self._submitted
+        return self.wait(ticket, timeout)
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self._journal.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopped)
+                if self._stopped and not self._pending:
+                    return
+            # Let the rest of this interval's check-ins pile up behind the first one.
+            time.sleep(self.interval)
+            with self._cond:
+                batch, self._pending = self._pending, []
+                clear_applied, self._clear_applied = self._clear_applied, False
+            try:
+                self._commit(batch, self.key, clear_applied)
+            except sqlite3.Error:
+                logger.exception('Group commit of %d check-ins failed, retrying', len(batch))
+                with self._cond:
+                    self._pending = batch + self._pending
+                    self._clear_applied = self._clear_applied or clear_applied
+                time.sleep(RETRY_DELAY)
+                continue
+            except Exception as e:
+                # Retrying won't help. The batch stays in the locked journal for
+                # the next start to replay, and submit() stops acknowledging.
+                logger.exception('Check-in writer stopped with %d check-ins in %s', len(batch), self.journal_path)
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._committed += len(batch)
+                if self._committed == self._submitted:
+                    # Everything journaled is now in the database.
+                    self._journal.truncate(0)
+                    os.fsync(self._journal.fileno())
+                    self._clear_applied = True
+                self._cond.notify_all()
+
+    def _commit(self, ops, key, clear_applied=False):
+        with db.connection('group_commit') as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if clear_applied:
+                conn.execute('DELETE FROM applied_writes WHERE journal = ?', (key,))
+            for op in ops:
+                if conn.execute('SELECT 1 FROM applied_writes WHERE op_id = ?', (op['id'],)).fetchone():
+                    continue
+                try:
+                    conn.execute(OPERATIONS[op['kind']], op['params'])
+                except sqlite3.IntegrityError:
+                    logger.exception('Dropping journaled %s check-in %s', op['kind'], op['id'])
+                conn.execute('INSERT INTO applied_writes (op_id, journal) VALUES (?, ?)', (op['id'], key))
+
+
+@st.cache_resource(show_spinner=False)
+def get_writer():
+    writer = CheckinWriter()
+    atexit.register(writer.close)
+    return writer
+
+
+def active():
+    # False once the writer has stopped, so check-ins go straight to the database.
+    return WRITE_BEHIND and get_writer().running
+
+
+def flush(timeout=5):
+    if WRITE_BEHIND:
+        return get_writer().flush(timeout)
+    return True